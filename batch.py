@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+
+"""
+Generate screenshots for many titles from a manifest.
+
+This script runs a list of screenshot jobs in a single process, so VapourSynth and its plugins
+are only loaded once. Each job accepts the same options as `screenshots.py` and is validated
+with the same rules. Completed (clip, frame) outputs are recorded in a checkpoint file, so
+rerunning an interrupted batch skips the work that already finished.
+
+The manifest can be JSON or TOML (TOML requires Python 3.11+). Keys in `defaults` are applied
+to every job, and job keys match the long argument names of `screenshots.py`. Jobs without an
+`output_directory` are saved to a folder named after the job, next to the manifest. Jobs using
+`random_frames` without a `seed` are seeded from the job name, so a resumed job picks the same
+frames::
+
+    {
+        "concurrency": 2,
+        "defaults": {"load_filter": "ffms2", "offset": 0},
+        "jobs": [
+            {
+                "name": "ex_machina",
+                "source": "/media/ex_machina_src.mkv",
+                "encodes": ["/media/t1.mkv", "/media/t2.mkv"],
+                "random_frames": [1000, 25000, 25],
+                "seed": 42,
+                "crop": [3840, 1600]
+            }
+        ]
+    }
+
+--- EXAMPLES ---
+
+Run a manifest with up to 3 jobs at once::
+
+    python batch.py '~/manifests/nightly.json' --concurrency 3
+
+Ignore an existing checkpoint and start over::
+
+    python batch.py '~/manifests/nightly.toml' --restart
+
+"""
+
+import argparse
+import json
+import threading
+import traceback
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import screenshots
+from modules import path_exists
+from modules.manifest import allocate_tags
+
+try:
+    import tomllib
+except ImportError:
+    tomllib = None
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=(
+            'Run screenshot jobs for many titles from a JSON or TOML manifest in a single process. '
+            'Finished outputs are checkpointed so an interrupted batch can be resumed.'
+        )
+    )
+    parser.add_argument('manifest', metavar='MANIFEST', type=path_exists,
+                        help='Path to the JSON or TOML manifest')
+    parser.add_argument('--concurrency', '-j', metavar='JOBS', type=int, nargs='?',
+                        help='Maximum number of jobs run at once. Overrides the manifest. Default is 1')
+    parser.add_argument('--checkpoint', '-cp', metavar='CHECKPOINT', type=Path, nargs='?',
+                        help="Checkpoint file. Default is '<manifest>.checkpoint.jsonl' next to the manifest")
+    parser.add_argument('--restart', action='store_true',
+                        help='Ignore the existing checkpoint and run every job from the start')
+
+    return parser.parse_args()
+
+
+def load_manifest(path: Path) -> dict:
+    """
+    Load a JSON or TOML manifest.
+    :param path: Path to the manifest
+    :return: Manifest contents
+    """
+
+    if path.suffix.lower() == '.toml':
+        if not tomllib:
+            raise ImportError("TOML manifests require Python 3.11 or newer. Use a JSON manifest instead")
+        with open(path, 'rb') as f:
+            manifest = tomllib.load(f)
+    else:
+        manifest = json.loads(path.read_text())
+
+    if not manifest.get('jobs'):
+        raise ValueError(f"No jobs found in manifest '{path}'")
+
+    return manifest
+
+
+def job_argv(job: dict) -> list[str]:
+    """
+    Convert a manifest job to `screenshots.py` arguments.
+    :param job: Job options, keyed by long argument name
+    :return: Argument list for `screenshots.parse_args`
+    """
+
+    argv = []
+    for key, value in job.items():
+        if key == 'name' or value is None or value is False:
+            continue
+        if value is True:
+            argv.append(f"--{key}")
+        elif isinstance(value, (list, tuple)) and value and isinstance(value[0], (list, tuple)):
+            # Repeated options, e.g. [["face", 100, 100, 64, 48], ["sky", 0, 0, 200, 100]] for --roi
+            for item in value:
+                argv.extend([f"--{key}", *(str(v) for v in item)])
+        elif isinstance(value, (list, tuple)):
+            argv.extend([f"--{key}", *(str(v) for v in value)])
+        else:
+            argv.extend([f"--{key}", str(value)])
+
+    return argv
+
+
+class Checkpoint:
+    """
+    Append-only record of finished outputs, shared by all jobs in a batch.
+
+    Each line is a JSON object. Tag lines record the tags allocated to a job's clips so resumed
+    jobs keep writing to the same file names, and output lines record each saved (clip, frame).
+    """
+
+    def __init__(self, path: Path, restart: bool = False):
+        """
+        :param path: Checkpoint file
+        :param restart: Discard the existing checkpoint
+        """
+
+        self.path = path
+        self.lock = threading.Lock()
+        self.tags = {}
+        self.done = {}
+
+        if restart:
+            path.unlink(missing_ok=True)
+        elif path.exists():
+            for line in path.read_text().splitlines():
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Partially written line from an interrupted run
+                    continue
+                if 'tags' in entry:
+                    self.tags[entry['job']] = entry['tags']
+                else:
+                    self.done.setdefault(entry['job'], set()).add((entry['file'], entry['frame']))
+
+    def _append(self, entry: dict) -> None:
+        with self.lock, open(self.path, 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+            f.flush()
+
+    def record_tags(self, job: str, tags: list[str]) -> None:
+        self.tags[job] = tags
+        self._append({'job': job, 'tags': tags})
+
+    def record_output(self, job: str, file: Path, frame: int, images: list[dict]) -> None:
+        self._append({'job': job, 'file': str(file), 'frame': frame, 'images': images})
+
+
+def job_seed(name: str) -> int:
+    """
+    Derive a seed for random frames from a job name. Stable across runs, unlike `hash`.
+    :param name: Job name
+    :return: Seed
+    """
+
+    return zlib.crc32(name.encode())
+
+
+def run_job(name: str, job: dict, checkpoint: Checkpoint) -> None:
+    """
+    Run a single manifest job, skipping outputs recorded in the checkpoint.
+    :param name: Job name
+    :param job: Job options, keyed by long argument name
+    :param checkpoint: Batch checkpoint
+    :return: Void
+    """
+
+    print(f"[{name}] Starting job")
+    # Resumed jobs must pick the same random frames, or the checkpointed frames and tags won't match
+    if job.get('random_frames') and job.get('seed') is None:
+        job = {**job, 'seed': job_seed(name)}
+    options = screenshots.parse_args(job_argv(job))
+    files, out_folder = options.files, options.out_folder
+
+    tags = checkpoint.tags.get(name)
+    if not tags or len(tags) != len(files):
+        tags = allocate_tags(out_folder, files)
+        checkpoint.record_tags(name, tags)
+
+    done = checkpoint.done.get(name, set())
+    skip = {(i, frame) for i, f in enumerate(files) for file, frame in done if file == str(f)}
+    if skip:
+        print(f"[{name}] Skipping {len(skip)} screenshots recorded in the checkpoint")
+
+    def on_saved(clip, frame, images):
+        checkpoint.record_output(name, files[clip], frame, images)
+
+    screenshots.run(options, tags=tags, skip=skip, on_saved=on_saved)
+    print(f"[{name}] Finished job")
+
+
+def main():
+    args = parse_args()
+    manifest = load_manifest(args.manifest)
+    checkpoint = Checkpoint(
+        args.checkpoint or args.manifest.with_name(args.manifest.stem + '.checkpoint.jsonl'),
+        restart=args.restart
+    )
+    concurrency = args.concurrency or manifest.get('concurrency', 1)
+    defaults = manifest.get('defaults', {})
+
+    jobs = {}
+    for i, job in enumerate(manifest['jobs']):
+        job = {**defaults, **job}
+        name = job.get('name') or Path(job.get('source') or job['encodes'][0]).stem
+        if name in jobs:
+            name = f"{name}-{i}"
+        job.setdefault('output_directory', str(args.manifest.parent / name))
+        jobs[name] = job
+
+    failed = []
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = {executor.submit(run_job, name, job, checkpoint): name for name, job in jobs.items()}
+        for future in futures:
+            try:
+                future.result()
+            except (Exception, SystemExit):
+                # argparse exits on invalid options. Report it and keep going with the other jobs
+                failed.append(futures[future])
+                print(f"[{futures[future]}] Job failed:\n{traceback.format_exc()}")
+
+    print(f"Completed {len(jobs) - len(failed)}/{len(jobs)} jobs")
+    if failed:
+        print(f"Failed jobs: {', '.join(failed)}. Rerun the manifest to resume them")
+
+
+if __name__ == '__main__':
+    main()
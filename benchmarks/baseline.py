@@ -0,0 +1,73 @@
+import json
+import platform
+import statistics
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable
+
+
+def measure(func: Callable[[], object], repeat: int = 3) -> float:
+    """
+    Time a function.
+    :param func: Function to time
+    :param repeat: Number of runs
+    :return: Median wall-clock time in seconds
+    """
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+
+    return statistics.median(times)
+
+
+def save_results(results: dict, path: Path) -> None:
+    """
+    Save benchmark results as a JSON baseline.
+    :param results: Results keyed by benchmark name, with timings in seconds
+    :param path: Output path
+    :return: Void
+    """
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps({
+        'created': datetime.now(timezone.utc).isoformat(),
+        'host': platform.node(),
+        'python': platform.python_version(),
+        'results': results
+    }, indent=2))
+    print(f"Baseline saved to '{path}'")
+
+
+# Timings below this many seconds are too noisy to flag as regressions
+MIN_TIME = 0.001
+
+
+def compare_results(results: dict, path: Path, tolerance: float = 0.1) -> bool:
+    """
+    Compare benchmark results against a saved baseline and print the differences.
+    :param results: Results keyed by benchmark name, with timings in seconds
+    :param path: Baseline path
+    :param tolerance: Allowed slowdown as a fraction of the baseline before it counts as a regression
+    :return: True if no benchmark regressed
+    """
+
+    baseline = json.loads(Path(path).read_text())['results']
+    ok = True
+    print(f"\n{'benchmark':<48}{'baseline':>12}{'current':>12}{'change':>10}")
+    for name, current in results.items():
+        if name not in baseline or not baseline[name]:
+            print(f"{name:<48}{'-':>12}{current:>12.4f}{'new':>10}")
+            continue
+        change = (current - baseline[name]) / baseline[name]
+        flag = ''
+        if change > tolerance and current > MIN_TIME:
+            flag = '  REGRESSION'
+            ok = False
+        print(f"{name:<48}{baseline[name]:>12.4f}{current:>12.4f}{change:>+10.1%}{flag}")
+
+    return ok
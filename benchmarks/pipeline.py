@@ -0,0 +1,257 @@
+"""
+Benchmark the screenshot and preview pipelines using synthetic clips.
+
+Deterministic sources are generated as a moving gradient, so no media files are required and
+results are comparable across machines. The gradient is drawn with `akarin.Expr`, or with numpy
+when the akarin plugin isn't installed. The two don't render at the same speed, so compare
+baselines made with the same generator. For each scenario, the benchmark times
+frame requests through the resized source and through the prepared clips (crop, tonemap, overlay),
+end-to-end screenshot output and the frame conversion done by `Preview.show_frame` (without
+drawing a window). Building the graphs only takes microseconds, so stages are timed per frame
+rendered through them. HDR scenarios carry fake HDR frame props and are skipped when the
+tonemapping plugins are missing.
+
+Indexing isn't covered since it needs real files; use `--report` on `screenshots.py` for that.
+
+Run from the repository root::
+
+    python -m benchmarks.pipeline --save benchmarks/baseline.json
+    python -m benchmarks.pipeline --compare benchmarks/baseline.json --tolerance 0.15
+
+"""
+
+import argparse
+import sys
+import tempfile
+from functools import lru_cache
+from pathlib import Path
+
+import vapoursynth as vs
+import numpy as np
+
+from benchmarks.baseline import measure, save_results, compare_results
+from modules import verify_resize, prepare_clips
+from modules.vs_preview.view import Conversions
+from screenshots import Options, generate_screenshots
+
+core = vs.core
+
+# Length of each synthetic clip. Screenshot frames are spread evenly across it
+LENGTH = 240
+# Pixels the numpy pattern moves each frame. Even, so subsampled chroma moves with it
+SHIFT = 4
+# name: (width, height, format, hdr, encode width, encode height)
+SCENARIOS = {
+    '1080p-8bit': (1920, 1080, vs.YUV420P8, False, 1920, 800),
+    '2160p-10bit': (3840, 2160, vs.YUV420P10, False, 3840, 1600),
+    '2160p-10bit-hdr': (3840, 2160, vs.YUV420P10, True, 3840, 1600),
+    '2160p-to-1080p': (3840, 2160, vs.YUV420P10, False, 1920, 800)
+}
+HDR_PROPS = {
+    '_Matrix': 9,
+    '_Transfer': 16,
+    '_Primaries': 9,
+    'MasteringDisplayMaxLuminance': 1000.0,
+    'MasteringDisplayMinLuminance': 0.005,
+    'ContentLightLevelMax': 1000,
+    'ContentLightLevelAverage': 400
+}
+SDR_PROPS = {
+    '_Matrix': 1,
+    '_Transfer': 1,
+    '_Primaries': 1
+}
+
+
+def synthetic_clip(width: int,
+                   height: int,
+                   fmt: vs.VideoFormat,
+                   hdr: bool = False,
+                   length: int = LENGTH,
+                   seed: int = 0) -> vs.VideoNode:
+
+    """
+    Build a deterministic synthetic source.
+    :param width: Clip width
+    :param height: Clip height
+    :param fmt: Clip format
+    :param hdr: Attach HDR10 frame props instead of BT.709 props
+    :param length: Number of frames
+    :param seed: Offset applied to the pattern, so encodes differ slightly from the source
+    :return: Synthetic clip
+    """
+
+    clip = core.std.BlankClip(width=width, height=height, format=fmt, length=length, fpsnum=24000, fpsden=1001)
+    peak = (1 << core.get_video_format(fmt).bits_per_sample) - 1
+    # Moving gradient so every frame differs and images don't compress to nothing
+    if hasattr(core, 'akarin'):
+        clip = core.akarin.Expr(clip, [f"X Y + N 3 * + {seed} + {peak} %", f"X 2 * N + {peak} %",
+                                       f"Y 2 * N + {peak} %"])
+    else:
+        clip = pattern_clip(clip, seed)
+
+    props = HDR_PROPS if hdr else SDR_PROPS
+    return core.std.SetFrameProps(clip, _ColorRange=1, _PictType='I', **props)
+
+
+@lru_cache(maxsize=None)
+def pattern_planes(width: int, height: int, fmt: int, seed: int) -> list[np.ndarray]:
+    """
+    Draw a gradient with noise for each plane of a format.
+    :param width: Frame width
+    :param height: Frame height
+    :param fmt: Frame format
+    :param seed: Offset applied to the pattern
+    :return: Plane arrays
+    """
+
+    info = core.get_video_format(fmt)
+    peak = (1 << info.bits_per_sample) - 1
+    dtype = np.uint8 if info.bytes_per_sample == 1 else np.uint16
+    planes = []
+    for p in range(info.num_planes):
+        w, h = (width, height) if p == 0 else (width >> info.subsampling_w, height >> info.subsampling_h)
+        noise = np.random.default_rng(seed * info.num_planes + p).integers(0, 64, size=(h, w))
+        planes.append(((np.add.outer(np.arange(h), np.arange(w) * (p + 1)) + noise + seed) % peak).astype(dtype))
+
+    return planes
+
+
+def pattern_clip(clip: vs.VideoNode, seed: int = 0) -> vs.VideoNode:
+    """
+    Draw a moving gradient without akarin. A wider frame is drawn once with numpy, and each frame
+    is a window of it moved `SHIFT` pixels further along.
+    :param clip: Blank clip setting the dimensions, format and length
+    :param seed: Offset applied to the pattern
+    :return: Patterned clip
+    """
+
+    wide = core.std.BlankClip(clip, width=clip.width + SHIFT * clip.num_frames, length=1)
+    planes = pattern_planes(wide.width, wide.height, wide.format.id, seed)
+
+    def draw(n, f):
+        f = f.copy()
+        for p, plane in enumerate(planes):
+            np.asarray(f[p])[...] = plane
+        return f
+
+    wide = core.std.Loop(core.std.ModifyFrame(wide, wide, draw), times=clip.num_frames)
+    return core.std.FrameEval(clip, lambda n: core.std.CropAbs(wide, clip.width, clip.height, left=n * SHIFT))
+
+
+def build_clips(scenario: tuple, encodes: int) -> tuple[list[vs.VideoNode], list[dict]]:
+    """
+    Build a synthetic source and encodes for a scenario.
+    :param scenario: Scenario from SCENARIOS
+    :param encodes: Number of encodes
+    :return: Clips and their metadata, as returned by the probe cache
+    """
+
+    width, height, fmt, hdr, enc_width, enc_height = scenario
+    clips = [synthetic_clip(width, height, fmt, hdr)]
+    clips += [synthetic_clip(enc_width, enc_height, fmt, hdr, seed=i + 1) for i in range(encodes)]
+    metadata = [{'matrix': 9 if hdr else 1} for _ in clips]
+
+    return clips, metadata
+
+
+def prepared_clips(scenario: tuple, encodes: int, frames: list[int] = None) -> list[vs.VideoNode]:
+    clips, metadata = build_clips(scenario, encodes)
+    clips[0] = verify_resize(clips)
+    return prepare_clips(clips, [clips[1].width, clips[1].height], metadata=metadata,
+                         frames=[frames for _ in clips] if frames else None)
+
+
+def request_frames(clips: list[vs.VideoNode], frames: list[int]) -> None:
+    """
+    Render frames from each clip, so every filter in the graph runs.
+    :param clips: Clips to render
+    :param frames: Frames to render from each clip
+    :return: Void
+    """
+
+    for clip in clips:
+        for n in frames:
+            clip.get_frame(n)
+
+
+def resized_source(scenario: tuple, encodes: int) -> vs.VideoNode:
+    clips, _ = build_clips(scenario, encodes)
+    return verify_resize(clips)
+
+
+def preview_frames(clip: vs.VideoNode, frames: list[int]) -> None:
+    """
+    Convert frames the same way `Preview.show_frame` does, without drawing a window.
+    :param clip: Prepared clip
+    :param frames: Frames to convert
+    :return: Void
+    """
+
+    rgb, _ = Conversions().toRGB(clip, depth=8, kernel='Point', sample_type=vs.INTEGER)
+    for n in frames:
+        f = rgb.get_frame(n)
+        np.dstack([np.asarray(f[p]) for p in (2, 1, 0)])
+
+
+def run_scenario(name: str, scenario: tuple, encodes: int, frames: list[int], repeat: int, sparse: bool) -> dict:
+    width, height, fmt, hdr, *_ = scenario
+    if hdr and not (hasattr(core, 'placebo') or hasattr(core, 'tonemap')):
+        print(f"Skipping '{name}': no tonemapping plugin found")
+        return {}
+
+    print(f"\n--- {name}: {encodes} encodes, {len(frames)} frames ---")
+    results = {}
+    # Graphs are built fresh for each run, so frames aren't served from the cache
+    elapsed = measure(lambda: request_frames([resized_source(scenario, encodes)], frames), repeat)
+    results[f"{name}/resize_frame"] = elapsed / len(frames)
+    elapsed = measure(lambda: request_frames(prepared_clips(scenario, encodes), frames), repeat)
+    results[f"{name}/prepare_frame"] = elapsed / (len(frames) * (encodes + 1))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        def screenshots():
+            prepared = prepared_clips(scenario, encodes, frames if sparse else None)
+            folder = Path(tmp) / f"run{len(list(Path(tmp).iterdir()))}"
+            generate_screenshots(prepared, folder, frames, Options(sparse=sparse),
+                                 matrices=None if hdr else [1] * len(prepared))
+
+        elapsed = measure(screenshots, repeat)
+        results[f"{name}/screenshots"] = elapsed
+        print(f"Screenshots: {elapsed:.3f}s, {len(frames) * (encodes + 1) / elapsed:.2f} images/s")
+
+    elapsed = measure(lambda: preview_frames(prepared_clips(scenario, encodes)[0], frames), repeat)
+    results[f"{name}/preview_show_frame"] = elapsed / len(frames)
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the screenshot pipeline with synthetic clips')
+    parser.add_argument('--scenarios', '-s', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS),
+                        help='Scenarios to run. Default runs all of them')
+    parser.add_argument('--encodes', '-e', type=int, default=2, help='Number of synthetic encodes. Default is 2')
+    parser.add_argument('--frames', '-f', type=int, default=10, help='Number of screenshot frames. Default is 10')
+    parser.add_argument('--repeat', '-r', type=int, default=3, help='Runs per benchmark, the median is kept. Default is 3')
+    parser.add_argument('--sparse', action='store_true', help='Benchmark screenshots in sparse clip mode')
+    parser.add_argument('--save', type=Path, help='Save results as a JSON baseline')
+    parser.add_argument('--compare', type=Path, help='Compare results against a JSON baseline')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='Allowed slowdown before a benchmark counts as a regression. Default is 0.1 (10%%)')
+    args = parser.parse_args()
+
+    frames = [i * (LENGTH - 1) // args.frames for i in range(args.frames)]
+    if not hasattr(core, 'akarin'):
+        print("akarin not found. Sources are drawn with numpy, so results aren't comparable with baselines "
+              "made with akarin")
+    results = {}
+    for name in args.scenarios:
+        results.update(run_scenario(name, SCENARIOS[name], args.encodes, frames, args.repeat, args.sparse))
+
+    if args.save:
+        save_results(results, args.save)
+    if args.compare and not compare_results(results, args.compare, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
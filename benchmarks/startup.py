@@ -0,0 +1,99 @@
+"""
+Benchmark CLI startup time.
+
+Each command is run in a fresh interpreter, so the timings include every import the scripts do
+before they can parse arguments. `--help` runs measure the cost paid by invocations that exit
+early (help, argument errors), and the import runs measure the cost of the `modules` package
+itself. Use `--imports` to list the slowest imports for one command using `python -X importtime`.
+
+Run from the repository root::
+
+    python -m benchmarks.startup --save startup.json
+    python -m benchmarks.startup --compare startup.json --imports
+
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from benchmarks.baseline import save_results, compare_results
+
+ROOT = Path(__file__).resolve().parent.parent
+COMMANDS = {
+    'python': ['-c', 'pass'],
+    'import_modules': ['-c', 'import modules'],
+    'screenshots_help': ['screenshots.py', '--help'],
+    'compare_help': ['compare.py', '--help'],
+    'batch_help': ['batch.py', '--help']
+}
+
+
+def time_command(args: list[str], repeat: int = 10) -> float:
+    """
+    Run a Python command in a fresh interpreter and time it.
+    :param args: Arguments passed to the interpreter
+    :param repeat: Number of runs. The median is kept
+    :return: Median wall time in seconds
+    """
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, *args], cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                       check=True)
+        timings.append(time.perf_counter() - start)
+
+    return statistics.median(timings)
+
+
+def slowest_imports(args: list[str], count: int = 15) -> list[tuple[int, str]]:
+    """
+    List the slowest imports of a command, including the time spent in their own imports.
+    :param args: Arguments passed to the interpreter
+    :param count: Number of imports to return
+    :return: (cumulative microseconds, module) pairs, slowest first
+    """
+
+    result = subprocess.run([sys.executable, '-X', 'importtime', *args], cwd=ROOT, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.PIPE, text=True)
+    imports = []
+    for line in result.stderr.splitlines():
+        parts = line.split('|')
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            imports.append((int(parts[1]), parts[2].strip()))
+
+    return sorted(imports, reverse=True)[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the startup time of the CLI scripts')
+    parser.add_argument('--commands', '-c', nargs='+', choices=list(COMMANDS), default=list(COMMANDS),
+                        help='Commands to time. Default runs all of them')
+    parser.add_argument('--repeat', '-r', type=int, default=10, help='Runs per command, the median is kept. Default is 10')
+    parser.add_argument('--imports', action='store_true', help='Also list the slowest imports of each command')
+    parser.add_argument('--save', type=Path, help='Save results as a JSON baseline')
+    parser.add_argument('--compare', type=Path, help='Compare results against a JSON baseline')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='Allowed slowdown before a command counts as a regression. Default is 0.1 (10%%)')
+    args = parser.parse_args()
+
+    results = {}
+    for name in args.commands:
+        results[f"startup/{name}"] = time_command(COMMANDS[name], args.repeat)
+        print(f"{name:<20} {results[f'startup/{name}'] * 1000:>8.1f} ms")
+        if args.imports:
+            for us, module in slowest_imports(COMMANDS[name]):
+                print(f"    {us / 1000:>8.1f} ms  {module}")
+
+    if args.save:
+        save_results(results, args.save)
+    if args.compare and not compare_results(results, args.compare, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -25,17 +25,31 @@ Run help to view all available options::
 import vapoursynth as vs
 
 import argparse
-import argcomplete
+from pathlib import Path
 from pprint import pformat
 
 from modules import (
-    Preview,
     path_exists,
     prepare_clips,
     verify_resize,
     get_dimensions,
-    load_clips
+    load_clips,
+    needs_tonemap,
+    IndexCache,
+    ProbeCache,
+    default_cache_dir,
+    DEFAULT_CACHE_SIZE
 )
+from modules.trace import Trace, span
+from modules.graph_profile import GraphProfiler
+from modules.tuning import apply_settings, load_profile
+
+try:
+    import argcomplete
+    completer = True
+except ImportError:
+    print("argcomplete not found. Autocomplete will be disabled on Linux shells")
+    completer = False
 
 core = vs.core
 
@@ -51,7 +65,8 @@ def parse_args():
         ),
         epilog='view module created by UniversalAI. All credit goes to them.'
     )
-    argcomplete.autocomplete(parser)
+    if completer:
+        argcomplete.autocomplete(parser)
 
     parser.add_argument('source', nargs='?', metavar='SOURCE', type=path_exists,
                         help='Path to source file. Required')
@@ -72,8 +87,29 @@ def parse_args():
                         help='Preview window resolution, which can be different from source. Default is 1080p (1920x1080)')
     parser.add_argument('--load_filter', '-lf', type=str, choices=('lsmas', 'ffms2'), default='ffms2',
                         help="Filter used to load & index clips. Default is 'ffms2'")
+    parser.add_argument('--index_workers', '-iw', metavar='WORKERS', type=int, nargs='?',
+                        help="Number of files indexed at once. Default indexes all files at once")
+    parser.add_argument('--index_cache', '-ic', metavar='CACHE_DIR', type=Path, nargs='?',
+                        default=default_cache_dir() / 'index',
+                        help="Directory where source indexes are cached. Default is the user cache directory")
+    parser.add_argument('--index_cache_size', '-is', metavar='GB', type=float, nargs='?',
+                        default=DEFAULT_CACHE_SIZE / 1024 ** 3,
+                        help=f"Maximum size of the index cache in GB. Default is {DEFAULT_CACHE_SIZE // 1024 ** 3}")
     parser.add_argument('--no_frame_info', '-ni', action='store_false',
                         help="Don't add frame info overlay to clips. This flag negates the default behavior")
+    parser.add_argument('--profile_filters', '-pf', action='store_true',
+                        help="Time each stage of the filter graph (decode, resize, crop, tonemap, overlay, RGB "
+                             "conversion) for every frame shown and print a summary when the preview is closed")
+    parser.add_argument('--trace', metavar='TRACE', type=Path, nargs='?',
+                        help="Save a timeline of indexing and frames shown in Chrome trace-event format when the "
+                             "preview is closed. With '--profile_filters', each frame's time in every filter stage is "
+                             "added too. Open it in Perfetto or chrome://tracing")
+    parser.add_argument('--threads', '-th', metavar='THREADS', type=int, nargs='?',
+                        help="Number of VapourSynth threads. Default is the CPU count, or the value tuned for this "
+                             "host by 'screenshots.py --autotune'")
+    parser.add_argument('--cache_size', '-cs', metavar='MB', type=int, nargs='?',
+                        help="Maximum size of the VapourSynth frame cache in MB. It is still lowered if RAM is short. "
+                             "Default is the VapourSynth default, or the value tuned for this host")
 
     args = parser.parse_args()
 
@@ -104,7 +140,13 @@ def parse_args():
             args.resize_kernel,
             args.no_frame_info,
             args.frames,
-            args.load_filter[0] if type(args.load_filter) is list else args.load_filter)
+            args.load_filter[0] if type(args.load_filter) is list else args.load_filter,
+            args.index_workers,
+            IndexCache(args.index_cache, int(args.index_cache_size * 1024 ** 3)),
+            args.trace,
+            args.profile_filters,
+            args.threads,
+            args.cache_size)
 
 
 def main():
@@ -116,7 +158,19 @@ def main():
      kernel,
      overlay,
      frames,
-     load_filter) = parse_args()
+     load_filter,
+     index_workers,
+     index_cache,
+     trace_path,
+     profile_filters,
+     threads,
+     cache_size) = parse_args()
+
+    tuned = load_profile()
+    apply_settings(threads or tuned.get('threads'), cache_size or tuned.get('cache_size'))
+
+    trace = Trace() if trace_path else None
+    profiler = GraphProfiler(trace) if profile_filters else None
 
     print("Source: ", files[0])
     print("Encodes: ", pformat(files[1:]))
@@ -125,11 +179,16 @@ def main():
     if titles and len(files) - len(titles) == 1:
         titles.insert(0, 'Source')
 
-    # Load clips
+    # Load clips. Metadata is probed once per file and cached next to the indexes
+    probe_cache = ProbeCache(index_cache.root.parent / 'probe')
     if folder:
-        clips = load_clips(folder=folder, load_filter=load_filter)
+        clips = load_clips(folder=folder, load_filter=load_filter, workers=index_workers,
+                           index_cache=index_cache, trace=trace)
+        metadata = None
     else:
-        clips = load_clips(files=files, load_filter=load_filter)
+        clips = load_clips(files=files, load_filter=load_filter, workers=index_workers,
+                           index_cache=index_cache, probe_cache=probe_cache, trace=trace)
+        metadata = [probe_cache.get(c, f, load_filter) for c, f in zip(clips, files)]
 
     # If frame range was specified
     if frames and frames[0] < frames[1]:
@@ -137,27 +196,47 @@ def main():
     elif frames and frames[0] >= frames[1]:
         raise ValueError("Invalid frame range. Start of range must be less than end")
 
+    if profiler:
+        clips = [profiler.probe(c, i, 'decode') for i, c in enumerate(clips)]
+
     # If crop not passed, use encode1 dimensions
     if not crop:
         crop = [clips[1].width, clips[1].height]
     # Check if source requires resizing and resize if needed
-    clips[0] = verify_resize(clips, kernel=kernel)
+    with span(trace, 'graph_resize'):
+        resized = verify_resize(clips, kernel=kernel)
+    if profiler and resized is not clips[0]:
+        resized = profiler.probe(resized, 0, 'resize')
+    clips[0] = resized
 
     # Crop, Tonemap (if applicable), and Frame Info (if applicable)
     kwargs = {
         'clips': clips,
         'crop_dimensions': crop,
         'clip_titles': titles if titles else None,
-        'add_frame_info': overlay
+        'add_frame_info': overlay,
+        'metadata': metadata,
+        'trace': trace,
+        'profiler': profiler
     }
     clips = prepare_clips(**kwargs)
 
+    if metadata and needs_tonemap(clips[0], metadata[0]):
+        metadata = None
+
     # Set view dimensions. Use encode clip as reference for better scaling
     view_width, view_height = get_dimensions(res, clip=clips[1])
     print(f"View dimensions: {view_width}x{view_height}\n")
 
-    # Display clips using view
-    Preview(clips, preview_width=view_width, preview_height=view_height)
+    # Display clips using view. Imported here since it loads OpenCV and numpy
+    from modules import Preview
+    Preview(clips, preview_width=view_width, preview_height=view_height, metadata=metadata, trace=trace,
+            profiler=profiler)
+
+    if profiler:
+        profiler.print_summary(titles)
+    if trace:
+        trace.write(trace_path)
 
 
 if __name__ == '__main__':
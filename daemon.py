@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+
+"""
+Serve screenshot requests from a long-running local process.
+
+Every run of `screenshots.py` starts VapourSynth, loads its plugins, opens the source indexes and
+builds the filter graph before the first frame is rendered. This script does that once per title
+and keeps the prepared clips of recently used titles in an LRU pool, so follow-up requests for a
+few more frames only pay for rendering and encoding.
+
+Requests are JSON objects with the same keys as a `batch.py` job, i.e. the long argument names of
+`screenshots.py`. Requests are rendered one at a time, and each response lists every image saved
+for each frame, with its variant and its path, or its archive and entry name. The server only
+listens on localhost or a Unix socket, since requests can read and write any path the user running
+it can::
+
+    POST /render
+    {
+        "source": "/media/ex_machina_src.mkv",
+        "encodes": ["/media/t1.mkv"],
+        "frames": [1200, 3400],
+        "output_directory": "/media/screens"
+    }
+
+    GET /status
+
+--- EXAMPLES ---
+
+Start the daemon on the default port, keeping up to 8 titles warm::
+
+    python daemon.py --pool_size 8
+
+Request screenshots over a Unix socket::
+
+    python daemon.py --socket /tmp/screenshots.sock
+    curl --unix-socket /tmp/screenshots.sock -d '{"source": "src.mkv", "frames": [100]}' http://localhost/render
+
+"""
+
+import argparse
+import json
+import os
+import socketserver
+import threading
+import time
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import screenshots
+from batch import job_argv
+from modules.pool import ClipPool
+
+DEFAULT_PORT = 8737
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=(
+            'Run a local screenshot service that keeps recently used titles loaded, so follow-up requests '
+            'skip loading plugins, opening indexes and building the filter graph.'
+        )
+    )
+    parser.add_argument('--port', '-p', metavar='PORT', type=int, nargs='?', default=DEFAULT_PORT,
+                        help=f"Port to listen on, on localhost. Default is {DEFAULT_PORT}")
+    parser.add_argument('--socket', '-s', metavar='SOCKET', type=Path, nargs='?',
+                        help="Listen on a Unix socket instead of a port")
+    parser.add_argument('--pool_size', '-ps', metavar='TITLES', type=int, nargs='?', default=4,
+                        help="Number of prepared titles kept in memory. The least recently used are dropped first. "
+                             "Default is 4")
+
+    return parser.parse_args()
+
+
+class ScreenshotService:
+    """
+    Renders requests one at a time against a shared pool of prepared clips.
+    """
+
+    def __init__(self, pool_size: int = 4):
+        """
+        :param pool_size: Number of prepared titles kept in memory
+        """
+
+        self.pool = ClipPool(pool_size)
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.renders = 0
+
+    def render(self, job: dict) -> dict:
+        """
+        Render one request.
+        :param job: Job options, keyed by long argument name
+        :return: Output folder, saved images and render time
+        """
+
+        options = screenshots.parse_args(job_argv(job))
+        files, out_folder = options.files, options.out_folder
+        outputs = []
+
+        def on_saved(clip, frame, images):
+            outputs.append({'clip': clip, 'file': str(files[clip]), 'frame': frame, 'images': images})
+
+        with self.lock:
+            start = time.perf_counter()
+            screenshots.run(options, on_saved=on_saved, pool=self.pool)
+            self.renders += 1
+
+        return {
+            'output_directory': str(out_folder),
+            'outputs': sorted(outputs, key=lambda o: (o['clip'], o['frame'])),
+            'seconds': round(time.perf_counter() - start, 3)
+        }
+
+    def status(self) -> dict:
+        return {'uptime': round(time.time() - self.started), 'renders': self.renders, 'pool': self.pool.summary()}
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    service: ScreenshotService = None
+
+    def address_string(self):
+        # Unix socket clients have no address
+        return self.client_address[0] if isinstance(self.client_address, tuple) else 'unix'
+
+    def _reply(self, code: int, body: dict) -> None:
+        data = json.dumps(body, indent=2).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.rstrip('/') == '/status':
+            self._reply(200, self.service.status())
+        else:
+            self._reply(404, {'error': f"Unknown endpoint '{self.path}'"})
+
+    def do_POST(self):
+        if self.path.rstrip('/') != '/render':
+            self._reply(404, {'error': f"Unknown endpoint '{self.path}'"})
+            return
+
+        try:
+            job = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            if not isinstance(job, dict):
+                raise ValueError("Request must be a JSON object of screenshots.py options")
+        except ValueError as e:
+            self._reply(400, {'error': str(e)})
+            return
+
+        try:
+            self._reply(200, self.service.render(job))
+        except SystemExit:
+            # argparse exits on invalid options after printing the reason
+            self._reply(400, {'error': 'Invalid options. See the daemon output for details'})
+        except (FileNotFoundError, NameError, ValueError) as e:
+            self._reply(400, {'error': str(e)})
+        except Exception as e:
+            print(traceback.format_exc())
+            self._reply(500, {'error': f"{type(e).__name__}: {e}"})
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def main():
+    args = parse_args()
+    RequestHandler.service = ScreenshotService(args.pool_size)
+
+    if args.socket:
+        args.socket.unlink(missing_ok=True)
+        server = UnixHTTPServer(str(args.socket), RequestHandler)
+        # Only the user running the daemon can send requests
+        os.chmod(args.socket, 0o600)
+        address = f"unix:{args.socket}"
+    else:
+        server = ThreadingHTTPServer(('127.0.0.1', args.port), RequestHandler)
+        address = f"http://127.0.0.1:{args.port}"
+
+    print(f"Screenshot daemon listening on {address}. Press Ctrl+C to stop")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.socket:
+            args.socket.unlink(missing_ok=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,2 +1,11 @@
 from .utils import *
-from .vs_preview.view import Preview
\ No newline at end of file
+from .cache import IndexCache, default_cache_dir, fingerprint, DEFAULT_CACHE_SIZE
+from .probe import ProbeCache, probe_clip
+
+
+def __getattr__(name):
+    # The preview stack pulls in OpenCV and numpy, so it's only imported when it's used
+    if name == 'Preview':
+        from .vs_preview.view import Preview
+        return Preview
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
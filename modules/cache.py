@@ -0,0 +1,182 @@
+import hashlib
+import json
+import os
+import sys
+import threading
+from pathlib import Path
+
+# Size of each block sampled when fingerprinting a file, and how many blocks are sampled
+SAMPLE_SIZE = 64 * 1024
+SAMPLE_COUNT = 8
+# Default maximum size of the index cache, in bytes
+DEFAULT_CACHE_SIZE = 10 * 1024 ** 3
+
+_fingerprints = {}
+_lock = threading.Lock()
+
+
+def default_cache_dir() -> Path:
+    """
+    Get the default cache directory for this platform.
+    :return: Path to the cache directory
+    """
+
+    if sys.platform == 'win32':
+        base = Path(os.environ.get('LOCALAPPDATA', Path.home() / 'AppData' / 'Local'))
+    elif sys.platform == 'darwin':
+        base = Path.home() / 'Library' / 'Caches'
+    else:
+        base = Path(os.environ.get('XDG_CACHE_HOME', Path.home() / '.cache'))
+
+    return base / 'vapoursynth-screenshots'
+
+
+def fingerprint(file: Path) -> str:
+    """
+    Compute a cheap fingerprint for a media file.
+
+    The fingerprint combines the file size, modification time and a hash of blocks sampled evenly
+    across the file, so replacing a file in place produces a new fingerprint without reading the
+    whole file. Results are memoized for the lifetime of the process.
+
+    :param file: Path to the file
+    :return: Hex digest identifying the file's contents
+    """
+
+    stat = Path(file).stat()
+    key = (str(file), stat.st_size, stat.st_mtime_ns)
+    with _lock:
+        if key in _fingerprints:
+            return _fingerprints[key]
+
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{stat.st_size}:{stat.st_mtime_ns}".encode())
+    with open(file, 'rb') as f:
+        step = max(stat.st_size // SAMPLE_COUNT, SAMPLE_SIZE)
+        for offset in range(0, stat.st_size, step):
+            f.seek(offset)
+            digest.update(f.read(SAMPLE_SIZE))
+
+    with _lock:
+        _fingerprints[key] = digest.hexdigest()
+
+    return _fingerprints[key]
+
+
+def evict_lru(entries: list[tuple[float, int, list[Path]]], max_size: int, keep: set[Path] = frozenset()) -> None:
+    """
+    Delete the least recently used cache entries until their total size fits within a limit.
+    :param entries: (last used time, size in bytes, files) for each entry. The first file identifies the entry
+    :param max_size: Maximum total size, in bytes
+    :param keep: Entries that are never evicted, e.g. because this process used them
+    :return: Void
+    """
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, files in sorted(entries, key=lambda e: e[0]):
+        if total <= max_size:
+            break
+        if files[0] in keep:
+            continue
+        for file in files:
+            file.unlink(missing_ok=True)
+        total -= size
+
+
+class IndexCache:
+    """
+    Central cache for source indexes.
+
+    Indexes are stored in a single directory keyed by the fingerprint of the media file instead of
+    next to the media, so they work on read-only mounts and can be shared across hosts and runs.
+    Each index has a metadata sidecar, written once indexing finishes, that records the index size.
+    It is used to validate the index on load and to track when it was last used, and the least
+    recently used indexes are evicted when the cache exceeds its size limit.
+    """
+
+    def __init__(self, root: Path = None, max_size: int = DEFAULT_CACHE_SIZE):
+        """
+        :param root: Cache directory. Default is the platform cache directory
+        :param max_size: Maximum total size of cached indexes, in bytes
+        """
+
+        self.root = Path(root or default_cache_dir() / 'index')
+        self.max_size = max_size
+        self.used = set()
+
+    def path(self, file: Path, suffix: str) -> Path:
+        """
+        Get the cached index path for a media file, discarding it if it fails validation.
+        :param file: Path to the media file
+        :param suffix: Index file suffix for the load filter
+        :return: Path where the index is (or will be) stored
+        """
+
+        file = Path(file)
+        fp = fingerprint(file)
+        index = self.root / f"{fp}{suffix}"
+
+        self.root.mkdir(parents=True, exist_ok=True)
+        if index.exists() and not self._valid(index, fp):
+            print(f"Discarding stale index for '{file.name}'")
+            index.unlink(missing_ok=True)
+        self.used.add(index)
+
+        return index
+
+    def commit(self, file: Path, index: Path) -> None:
+        """
+        Record a finished index in its metadata sidecar. Call once the load filter has returned, so
+        an index left behind by an interrupted run has no sidecar (or one with the wrong size) and
+        is rebuilt on the next load.
+        :param file: Path to the media file
+        :param index: Index path returned by `path`
+        :return: Void
+        """
+
+        try:
+            index_size = index.stat().st_size
+        except FileNotFoundError:
+            return
+
+        file = Path(file)
+        stat = file.stat()
+        meta = index.with_name(index.name + '.json')
+        # Other processes may be validating the same index, so never leave a partly written sidecar
+        tmp = meta.with_name(f"{meta.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_text(json.dumps({
+            'fingerprint': fingerprint(file),
+            'name': file.name,
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'index_size': index_size
+        }))
+        os.replace(tmp, meta)
+
+    @staticmethod
+    def _valid(index: Path, fp: str) -> bool:
+        try:
+            meta = json.loads(index.with_name(index.name + '.json').read_text())
+            return meta['fingerprint'] == fp and index.stat().st_size == meta['index_size'] > 0
+        except (OSError, ValueError, KeyError):
+            return False
+
+    def evict(self) -> None:
+        """
+        Delete the least recently used indexes until the cache fits within its size limit.
+        Indexes used by this process are never evicted.
+        :return: Void
+        """
+
+        if not self.root.exists():
+            return
+
+        entries = []
+        for meta in self.root.glob('*.json'):
+            index = meta.with_suffix('')
+            try:
+                entries.append((meta.stat().st_mtime, index.stat().st_size + meta.stat().st_size, [index, meta]))
+            except FileNotFoundError:
+                meta.unlink(missing_ok=True)
+
+        evict_lru(entries, self.max_size, self.used)
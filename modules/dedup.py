@@ -0,0 +1,161 @@
+import hashlib
+import os
+import shutil
+import threading
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from .cache import DEFAULT_CACHE_SIZE, default_cache_dir, evict_lru
+
+if TYPE_CHECKING:
+    import numpy as np
+
+
+def link_file(source: Path, path: Path) -> int:
+    """
+    Hardlink a file to a new path, replacing any file already there. Copies the file instead when
+    the two paths are on different filesystems.
+    :param source: Existing file
+    :param path: New path
+    :return: Size of the file in bytes
+    """
+
+    path.unlink(missing_ok=True)
+    try:
+        os.link(source, path)
+    except OSError:
+        shutil.copyfile(source, path)
+
+    return path.stat().st_size
+
+
+def write_file(path: Path, data: bytes) -> int:
+    """
+    Write a file, replacing any file already there with a new one. Writing into the old file would
+    also change the image store entry it may be hardlinked to.
+    :param path: Path to write
+    :param data: File contents
+    :return: Number of bytes written
+    """
+
+    path.unlink(missing_ok=True)
+    return path.write_bytes(data)
+
+
+class ImageStore:
+    """
+    Content-addressed store of encoded images, shared across runs.
+
+    Each image is keyed by a hash of its pixels and the encoder settings, so a frame that renders
+    identically to one saved earlier (e.g. the source frames of a later test round) is linked from
+    the store instead of being encoded again. Images written as files are hardlinked into the
+    store, so they only take up disk space once. Once the output folders are deleted, the store
+    holds the only copy, so the least recently used images are evicted when the store exceeds its
+    size limit.
+    """
+
+    def __init__(self, root: Path = None, max_size: int = DEFAULT_CACHE_SIZE):
+        """
+        :param root: Store directory. Default is the platform cache directory
+        :param max_size: Maximum total size of stored images, in bytes
+        """
+
+        self.root = Path(root or default_cache_dir() / 'images')
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.used = set()
+        self.hits = 0
+        self.misses = 0
+
+    def __reduce__(self):
+        # Locks can't be pickled. Worker processes get their own lock and statistics
+        return self.__class__, (self.root, self.max_size)
+
+    @staticmethod
+    def key(image: 'np.ndarray', suffix: str, params: list[int] = None) -> str:
+        """
+        Hash an image before it is encoded.
+        :param image: BGR image array
+        :param suffix: Output suffix. The same pixels encode to different files in each format
+        :param params: Encoder parameters from `encode_params`
+        :return: Hex digest identifying the encoded image
+        """
+
+        import numpy as np
+
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(f"{image.shape}:{image.dtype}:{suffix}:{params}".encode())
+        digest.update(np.ascontiguousarray(image).data)
+
+        return digest.hexdigest()
+
+    def path(self, key: str, suffix: str) -> Path:
+        return self.root / key[:2] / f"{key}{suffix}"
+
+    def find(self, key: str, suffix: str) -> Path | None:
+        """
+        Look up an encoded image. Hits are marked as recently used.
+        :param key: Key returned by `key`
+        :param suffix: Output suffix
+        :return: Path of the stored image, or None if it isn't stored
+        """
+
+        path = self.path(key, suffix)
+        try:
+            os.utime(path)
+            found = True
+        except FileNotFoundError:
+            found = False
+        with self.lock:
+            if found:
+                self.hits += 1
+                self.used.add(path)
+            else:
+                self.misses += 1
+
+        return path if found else None
+
+    def add(self, key: str, suffix: str, data: bytes, source: Path = None) -> None:
+        """
+        Add an encoded image to the store.
+        :param key: Key returned by `key`
+        :param suffix: Output suffix
+        :param data: Encoded image
+        :param source: File the image was written to. Hardlinked into the store instead of writing `data` again
+        :return: Void
+        """
+
+        path = self.path(key, suffix)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Concurrent writers can store the same image. Both copies are identical, so the last one wins
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            os.link(source, tmp) if source else tmp.write_bytes(data)
+        except OSError:
+            tmp.write_bytes(data)
+        os.replace(tmp, path)
+        with self.lock:
+            self.used.add(path)
+
+    def evict(self) -> None:
+        """
+        Delete the least recently used images until the store fits within its size limit.
+        Images used by this process are never evicted.
+        :return: Void
+        """
+
+        if not self.root.exists():
+            return
+
+        entries = []
+        for path in self.root.glob('*/*'):
+            # Images still being added by another process
+            if path.suffix == '.tmp':
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, [path]))
+
+        evict_lru(entries, self.max_size, self.used)
@@ -0,0 +1,240 @@
+import multiprocessing
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+from typing import TYPE_CHECKING
+
+import vapoursynth as vs
+
+from .render import encode_image
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# Shared memory attached by an encoder process, keyed by slot
+_attached = {}
+
+
+def _encode_slot(slot: str,
+                 name: str,
+                 shape: tuple,
+                 dtype: str,
+                 suffix: str,
+                 params: list[int] = None,
+                 offset: int = 0,
+                 strides: tuple = None) -> bytes:
+    """
+    Encode an image held in a shared memory slot. Runs in an encoder process.
+    :param slot: Pool and number of the slot
+    :param name: Name of the slot's shared memory block
+    :param shape: Shape of the image
+    :param dtype: Data type of the image
+    :param suffix: File suffix of the output format, such as '.png'
+    :param params: Encoder parameters from `encode_params`
+    :param offset: Position of the image in the slot, in bytes
+    :param strides: Strides of the image. Default is C-contiguous
+    :return: Encoded image
+    """
+
+    import numpy as np
+
+    attached = _attached.get(slot)
+    # Slots are replaced when a larger image arrives. Drop the old block so it can be freed
+    if attached is None or attached.name != name:
+        if attached is not None:
+            attached.close()
+        attached = _attached[slot] = shared_memory.SharedMemory(name=name)
+
+    image = np.ndarray(shape, dtype=dtype, buffer=attached.buf, offset=offset, strides=strides)
+    return encode_image(image, suffix, params)
+
+
+class SlotPool:
+    """
+    Fixed number of shared memory blocks used to hand images to other processes.
+
+    A slot is held from the moment an image is copied in until the other process is done with
+    it, and `slot` blocks while every slot is busy, so the memory used for images in transit
+    never exceeds the slot count times the largest image.
+    """
+
+    def __init__(self, slots: int):
+        """
+        :param slots: Number of slots
+        """
+
+        self.memory = [None] * slots
+        self.free = queue.Queue()
+        for i in range(slots):
+            self.free.put(i)
+
+    def acquire(self, size: int) -> tuple[int, shared_memory.SharedMemory]:
+        """
+        Hold a free slot of at least `size` bytes until it is released. Blocks until a slot is free.
+        :param size: Number of bytes needed
+        :return: Slot number and its shared memory block
+        """
+
+        index = self.free.get()
+        try:
+            memory = self.memory[index]
+            if memory is None or memory.size < size:
+                if memory is not None:
+                    memory.close()
+                    memory.unlink()
+                memory = self.memory[index] = shared_memory.SharedMemory(create=True, size=size)
+        except BaseException:
+            self.free.put(index)
+            raise
+
+        return index, memory
+
+    def release(self, index: int) -> None:
+        self.free.put(index)
+
+    @contextmanager
+    def slot(self, size: int):
+        """
+        Hold a free slot of at least `size` bytes. Blocks until a slot is free.
+        :param size: Number of bytes needed
+        """
+
+        index, memory = self.acquire(size)
+        try:
+            yield index, memory
+        finally:
+            self.release(index)
+
+    def close(self) -> None:
+        for memory in self.memory:
+            if memory is not None:
+                try:
+                    memory.close()
+                except BufferError:
+                    # Arrays still point into the block. It is unmapped once they are gone
+                    pass
+                memory.unlink()
+        self.memory = [None] * len(self.memory)
+
+
+class ProcessEncoder:
+    """
+    Encodes images in a pool of processes, so encoding isn't limited by the GIL.
+
+    Rendered frames are written plane by plane into a shared memory frame slot with
+    `frame_to_array`, and only the slot, position and shape of each image cut from it are sent to
+    the encoder process, so a frame is copied once between VapourSynth and the encoder. Other
+    images, such as thumbnails and grids, are copied into a separate pool of slots first. The
+    encoded image, which is much smaller, is sent back. `frame_to_array` and `encode` block while
+    every slot is busy.
+    """
+
+    def __init__(self, processes: int, slots: int = None, frame_slots: int = None):
+        """
+        :param processes: Number of encoder processes
+        :param slots: Number of shared memory slots for images that aren't in a frame slot. Default is one per process
+        :param frame_slots: Number of shared memory slots for rendered frames. Default is twice the process count
+        """
+
+        self.processes = processes
+        self.pool = SlotPool(slots or processes)
+        self.frames = SlotPool(frame_slots or processes * 2)
+        # Number of users of each frame slot, and where each held slot is mapped
+        self.lock = threading.Lock()
+        self.holds = {}
+        self.addresses = {}
+        self.executor = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn'))
+
+    def frame_to_array(self, frame: vs.VideoFrame) -> 'np.ndarray':
+        """
+        Write an RGB frame into a frame slot as a packed BGR array. Blocks until a slot is free.
+        The slot is held until `release` is called with the array.
+        :param frame: RGB VideoFrame
+        :return: BGR image array backed by the slot
+        """
+
+        import numpy as np
+
+        planes = [np.asarray(frame[p]) for p in (2, 1, 0)]
+        shape = (*planes[0].shape, 3)
+        index, memory = self.frames.acquire(planes[0].nbytes * 3)
+        image = np.ndarray(shape, dtype=planes[0].dtype, buffer=memory.buf)
+        for i, plane in enumerate(planes):
+            image[..., i] = plane
+        with self.lock:
+            self.holds[index] = 1
+            self.addresses[index] = image.ctypes.data
+
+        return image
+
+    def _frame_slot(self, image: 'np.ndarray') -> int | None:
+        # Views of a frame, such as the halves of a stacked frame, point into the same slot
+        address = image.ctypes.data
+        for index, start in self.addresses.items():
+            if start <= address < start + self.frames.memory[index].size:
+                return index
+        return None
+
+    def hold(self, image: 'np.ndarray') -> None:
+        """
+        Keep the frame slot an image points into from being reused until `release` is called with it.
+        Does nothing for images that aren't in a frame slot.
+        :param image: Image array
+        :return: Void
+        """
+
+        with self.lock:
+            index = self._frame_slot(image)
+            if index is not None:
+                self.holds[index] += 1
+
+    def release(self, image: 'np.ndarray') -> None:
+        """
+        Drop a hold on the frame slot an image points into. The slot is reused once every hold is dropped.
+        :param image: Image array
+        :return: Void
+        """
+
+        with self.lock:
+            index = self._frame_slot(image)
+            if index is None:
+                return
+            self.holds[index] -= 1
+            if self.holds[index]:
+                return
+            del self.holds[index], self.addresses[index]
+        self.frames.release(index)
+
+    def encode(self, image: 'np.ndarray', suffix: str = '.png', params: list[int] = None) -> bytes:
+        """
+        Encode an image in an encoder process. Safe to call from multiple threads. Images in a held
+        frame slot are encoded in place, and other images are copied into a slot first.
+        :param image: BGR image array
+        :param suffix: File suffix of the output format, such as '.png'
+        :param params: Encoder parameters from `encode_params`
+        :return: Encoded image
+        """
+
+        import numpy as np
+
+        with self.lock:
+            index = self._frame_slot(image)
+        if index is not None:
+            memory = self.frames.memory[index]
+            offset = image.ctypes.data - self.addresses[index]
+            future = self.executor.submit(_encode_slot, f"frame-{index}", memory.name, image.shape, image.dtype.str,
+                                          suffix, params, offset, image.strides)
+            return future.result()
+
+        with self.pool.slot(image.nbytes) as (index, memory):
+            np.ndarray(image.shape, dtype=image.dtype, buffer=memory.buf)[...] = image
+            future = self.executor.submit(_encode_slot, f"image-{index}", memory.name, image.shape, image.dtype.str,
+                                          suffix, params)
+            return future.result()
+
+    def close(self) -> None:
+        self.executor.shutdown()
+        self.pool.close()
+        self.frames.close()
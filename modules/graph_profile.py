@@ -0,0 +1,148 @@
+import threading
+import time
+from functools import partial
+
+import vapoursynth as vs
+
+from .report import percentiles
+from .trace import Trace
+
+core = vs.core
+
+
+class GraphProfiler:
+    """
+    Attributes frame time to each stage of a clip's filter graph.
+
+    Probes are inserted between stages with `probe`. Each probe is a `std.ModifyFrame` that
+    records when the frame from the stage below it is ready, and `request` wraps the final clip in
+    a `std.FrameEval` that records when a frame is requested. Once a frame is delivered, the time
+    spent in each stage is the gap between its probe and the probe before it, and the first stage
+    is measured from the request.
+
+    Timings are wall-clock and include time spent waiting for a worker thread, so they are most
+    useful for comparing stages against each other. Probes run a Python callback for every frame,
+    so only add them when profiling.
+
+    When a trace is passed, each frame's time in every stage is also added to its clip's track,
+    next to the frame request it belongs to.
+    """
+
+    def __init__(self, trace: Trace = None):
+        """
+        :param trace: Trace the per-frame stage timings are added to
+        """
+
+        self.trace = trace
+        self.lock = threading.Lock()
+        self.marks = {}
+        self.stages = {}
+        self.timings = {}
+        self.positions = {}
+
+    def set_frames(self, clip: int, frames: list[int]) -> None:
+        """
+        Map frame numbers of a sparse clip back to the source, so probes added before and after
+        `sparse_clip` refer to the same frames.
+        :param clip: Clip index
+        :param frames: Frames kept by `sparse_clip`, as returned by `sparse_frames`
+        :return: Void
+        """
+
+        self.positions[clip] = frames
+
+    def _mark(self, clip: int, name: str, sparse: bool, n: int) -> None:
+        if sparse and clip in self.positions:
+            n = self.positions[clip][n]
+        with self.lock:
+            if name == 'request':
+                # Drop marks left by earlier reads of this frame, e.g. probing frame 0 for props
+                self.marks[(clip, n)] = {}
+            self.marks.setdefault((clip, n), {})[name] = time.perf_counter()
+
+    def probe(self, clip: vs.VideoNode, index: int, name: str, sparse: bool = True) -> vs.VideoNode:
+        """
+        Insert a probe that marks the end of a stage.
+        :param clip: Output of the stage
+        :param index: Clip index
+        :param name: Stage name
+        :param sparse: Boolean indicating if `clip` was built on a sparse clip. False for probes added before trimming
+        :return: Clip with the probe
+        """
+
+        stages = self.stages.setdefault(index, [])
+        if name not in stages:
+            stages.append(name)
+
+        def modify(n, f):
+            self._mark(index, name, sparse, n)
+            return f
+
+        return core.std.ModifyFrame(clip, clip, modify)
+
+    def request(self, clip: vs.VideoNode, index: int) -> vs.VideoNode:
+        """
+        Wrap the final clip so frame requests are timed. Add this after the last probe.
+        :param clip: Final clip
+        :param index: Clip index
+        :return: Clip that records when each frame is requested and delivered
+        """
+
+        def requested(n, clip):
+            self._mark(index, 'request', True, n)
+            return clip
+
+        def delivered(n, f):
+            self._finish(index, n)
+            return f
+
+        clip = core.std.ModifyFrame(clip, clip, delivered)
+        return core.std.FrameEval(clip, partial(requested, clip=clip))
+
+    def _finish(self, clip: int, n: int) -> None:
+        if clip in self.positions:
+            n = self.positions[clip][n]
+        with self.lock:
+            marks = self.marks.pop((clip, n), {})
+            # Frames served from the cache skip the probes below, so only complete frames count
+            if 'request' not in marks:
+                return
+            previous = marks['request']
+            for name in self.stages.get(clip, []):
+                if name in marks:
+                    self.timings.setdefault(clip, {}).setdefault(name, []).append(marks[name] - previous)
+                    if self.trace:
+                        self.trace.add_async(name, f"clip {clip}", self.trace.timestamp(previous),
+                                             self.trace.timestamp(marks[name]), clip=clip, frame=n)
+                    previous = marks[name]
+
+    def summary(self) -> dict:
+        """
+        Summarize stage timings.
+        :return: Percentiles in milliseconds for each stage, keyed by clip index
+        """
+
+        with self.lock:
+            return {
+                clip: {name: {'frames': len(t), **percentiles(t)} for name, t in stages.items()}
+                for clip, stages in sorted(self.timings.items())
+            }
+
+    def print_summary(self, titles: list[str] = None) -> None:
+        """
+        Print mean, p95 and max milliseconds for each stage of each clip.
+        :param titles: Clip titles. Default labels clips by index
+        :return: Void
+        """
+
+        summary = self.summary()
+        if not summary:
+            print("Filter profile: no frames were profiled")
+            return
+
+        print("\n--- Filter profile (ms per frame) ---")
+        print(f"{'Clip':<24} {'Stage':<10} {'Frames':>6} {'Mean':>9} {'p95':>9} {'Max':>9}")
+        for clip, stages in summary.items():
+            title = titles[clip] if titles and clip < len(titles) else f"Clip {clip}"
+            for name, t in stages.items():
+                print(f"{title[:24]:<24} {name:<10} {t['frames']:>6} {t['mean']:>9.2f} {t['p95']:>9.2f} {t['max']:>9.2f}")
@@ -0,0 +1,138 @@
+import math
+from typing import TYPE_CHECKING
+
+from .render import thumbnail
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# Grids that can be built while rendering
+GRIDS = ('contact', 'compare')
+
+
+def label_tile(image: 'np.ndarray', text: str) -> 'np.ndarray':
+    """
+    Add a label strip above an image.
+    :param image: BGR image array
+    :param text: Label text
+    :return: Labelled image
+    """
+
+    import numpy as np
+    import cv2
+
+    width = image.shape[1]
+    scale = max(width / 960, 0.35)
+    height = int(36 * scale) + 8
+    strip = np.zeros((height, width, 3), dtype=image.dtype)
+    cv2.putText(strip, text, (6, height - 8), cv2.FONT_HERSHEY_SIMPLEX, scale, (255, 255, 255), 1, cv2.LINE_AA)
+
+    return np.vstack([strip, image])
+
+
+def tile_images(images: list['np.ndarray | None'], columns: int = None) -> 'np.ndarray':
+    """
+    Tile equally sized images into a grid, row by row.
+    :param images: Images to tile. Missing images (None) are left black
+    :param columns: Number of columns. Default makes the grid roughly square
+    :return: Grid image
+    """
+
+    import numpy as np
+
+    shape = next(i for i in images if i is not None).shape
+    columns = min(columns or math.ceil(math.sqrt(len(images))), len(images))
+    rows = math.ceil(len(images) / columns)
+
+    tiles = np.zeros((rows * columns, *shape), dtype=np.uint8)
+    for i, image in enumerate(images):
+        if image is not None:
+            tiles[i] = image
+
+    # (rows, columns, h, w, c) -> (rows, h, columns, w, c) -> one image
+    return tiles.reshape(rows, columns, *shape).swapaxes(1, 2).reshape(rows * shape[0], columns * shape[1], shape[2])
+
+
+class GridBuilder:
+    """
+    Builds contact sheets and comparison grids from rendered frames as they arrive.
+
+    Each frame is downscaled to a labelled tile once. A comparison grid (one frame across every
+    clip) is returned as soon as its last tile arrives, and contact sheets (every frame of one
+    clip) are returned by `finish`. Only the small tiles are kept in memory. Grids missing a tile,
+    e.g. because frames saved by an earlier run were skipped, are never returned, so they don't
+    replace the complete grids written by that run.
+    """
+
+    def __init__(self,
+                 grids: list[str],
+                 titles: list[str],
+                 tags: list[str],
+                 frame_count: int,
+                 tile_width: int = 480,
+                 columns: int = None):
+        """
+        :param grids: Grids to build. One or more of GRIDS
+        :param titles: Title of each clip. Clips are titled by index if the lengths don't match
+        :param tags: Tag of each clip. Sets the number of clips, and names the grids so every run has its own
+        :param frame_count: Number of screenshots per clip
+        :param tile_width: Width of each tile
+        :param columns: Number of grid columns. Default makes grids roughly square
+        """
+
+        self.grids = grids
+        self.titles = titles if titles and len(titles) == len(tags) else [f"Clip {i}" for i in range(len(tags))]
+        self.tags = tags
+        # e.g. 'a-c' for clips tagged a, b and c
+        self.run_tag = tags[0] if len(tags) == 1 else f"{tags[0]}-{tags[-1]}"
+        self.frame_count = frame_count
+        self.tile_width = tile_width
+        self.columns = columns
+        self.compare = {}
+        self.contact = {}
+        self.incomplete = []
+
+    def add(self, clip: int, index: int, frame: int, image: 'np.ndarray') -> list[tuple['np.ndarray', str]]:
+        """
+        Add a rendered frame.
+        :param clip: Clip index
+        :param index: Screenshot number, starting at 1
+        :param frame: Original frame number, used in the labels
+        :param image: Full size BGR image
+        :return: Grids completed by this frame, as (image, name) pairs
+        """
+
+        tile = thumbnail(image, self.tile_width)
+
+        done = []
+        if 'compare' in self.grids:
+            tiles = self.compare.setdefault(index, [None] * len(self.tags))
+            tiles[clip] = label_tile(tile, f"{self.titles[clip]} - frame {frame}")
+            if all(t is not None for t in tiles):
+                done.append((tile_images(self.compare.pop(index), self.columns), self._compare_name(index)))
+        if 'contact' in self.grids:
+            self.contact.setdefault(clip, [None] * self.frame_count)[index - 1] = label_tile(tile, f"Frame {frame}")
+
+        return done
+
+    def _compare_name(self, index: int) -> str:
+        return f"compare-{index:02d}{self.run_tag}"
+
+    def finish(self) -> list[tuple['np.ndarray', str]]:
+        """
+        Build the remaining contact sheets. Grids that are still missing tiles are recorded in `incomplete`.
+        :return: Grids as (image, name) pairs
+        """
+
+        grids = [(t, self._compare_name(i)) for i, t in sorted(self.compare.items())]
+        grids += [(t, f"contact-{self.tags[c]}") for c, t in sorted(self.contact.items())]
+        self.compare, self.contact = {}, {}
+
+        done = []
+        for tiles, name in grids:
+            if any(t is None for t in tiles):
+                self.incomplete.append(name)
+            else:
+                done.append((tile_images(tiles, self.columns), name))
+
+        return done
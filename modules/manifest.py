@@ -0,0 +1,200 @@
+import json
+import os
+import re
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable
+
+# Manifest saved in each screenshot folder, recording the tag used for each clip
+MANIFEST_NAME = 'screenshots.json'
+# Run counter saved in the media folder, used to name new screenshot folders
+RUNS_NAME = '.screenshots.json'
+IMAGE_SUFFIXES = ('.png', '.jpg', '.jpeg', '.webp', '.ppm')
+
+
+def tag_name(index: int) -> str:
+    """
+    Convert a tag number to letters: 0 is 'a', 25 is 'z', 26 is 'aa', 27 is 'ab', etc.
+    :param index: Tag number
+    :return: Tag
+    """
+
+    tag = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        tag = chr(ord('a') + remainder) + tag
+
+    return tag
+
+
+def tag_index(tag: str) -> int:
+    """
+    Convert a tag back to its number. The inverse of `tag_name`.
+    :param tag: Tag
+    :return: Tag number
+    """
+
+    index = 0
+    for char in tag.lower():
+        index = index * 26 + ord(char) - ord('a') + 1
+
+    return index - 1
+
+
+@contextmanager
+def file_lock(path: Path):
+    """
+    Hold an exclusive lock on a file, so concurrent runs (or threads) take turns updating a manifest.
+    :param path: Lock file. Created if it doesn't exist
+    """
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'a+b') as f:
+        if os.name == 'nt':
+            import msvcrt
+            f.seek(0)
+            # LK_LOCK retries for 10 seconds before raising
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def legacy_tag_count(folder: Path) -> int:
+    """
+    Find the next free tag in a folder created before manifests existed by scanning image names.
+    :param folder: Screenshot folder
+    :return: Number of the first unused tag
+    """
+
+    used = -1
+    if folder.exists():
+        for file in folder.iterdir():
+            match = re.fullmatch(r"\d+([a-z]+)", file.stem)
+            if file.suffix.lower() in IMAGE_SUFFIXES and match:
+                used = max(used, tag_index(match[1]))
+
+    return used + 1
+
+
+class Manifest:
+    """
+    JSON sidecar that is read and rewritten under a file lock.
+
+    Updates are made through `update`, which holds the lock for the whole read-modify-write and
+    replaces the file atomically, so concurrent runs writing to the same folder never lose each
+    other's changes or read a partially written file.
+    """
+
+    def __init__(self, path: Path):
+        """
+        :param path: Manifest file
+        """
+
+        self.path = Path(path)
+        self.lock_path = self.path.with_name(f".{self.path.name.lstrip('.')}.lock")
+
+    def read(self) -> dict:
+        try:
+            return json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            return {}
+
+    def update(self, func: Callable[[dict], object]):
+        """
+        Modify the manifest while holding its lock.
+        :param func: Function that edits the manifest contents in place
+        :return: The value returned by `func`
+        """
+
+        with file_lock(self.lock_path):
+            data = self.read()
+            result = func(data)
+            tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+            tmp.write_text(json.dumps(data, indent=2))
+            os.replace(tmp, self.path)
+
+        return result
+
+
+def allocate_tags(folder: Path, files: list[Path], frames: list[list[int]] = None) -> list[str]:
+    """
+    Allocate a new tag for each clip and record it in the folder's manifest.
+
+    Tags are handed out from a counter stored in the manifest, so allocation doesn't depend on
+    the number of files in the folder and isn't limited to 26 clips. Folders created before
+    manifests existed are scanned once to seed the counter.
+
+    :param folder: Screenshot folder
+    :param files: Media file for each clip
+    :param frames: Frames screenshotted for each clip
+    :return: Tag for each clip
+    """
+
+    created = datetime.now(timezone.utc).isoformat()
+
+    def allocate(data):
+        if 'next_tag' not in data:
+            data.update({'version': 1, 'next_tag': legacy_tag_count(folder), 'runs': 0, 'clips': {}})
+        start = data['next_tag']
+        data['next_tag'] += len(files)
+        data['runs'] += 1
+
+        tags = [tag_name(start + i) for i in range(len(files))]
+        for i, (tag, file) in enumerate(zip(tags, files)):
+            data['clips'][tag] = {
+                'file': str(file) if file else None,
+                'frames': frames[i] if frames else None,
+                'run': data['runs'],
+                'created': created
+            }
+        return tags
+
+    return Manifest(folder / MANIFEST_NAME).update(allocate)
+
+
+def record_duplicates(folder: Path, duplicates: list[tuple[Path, str]]) -> None:
+    """
+    Record images that were linked from the image store instead of being encoded.
+    :param folder: Screenshot folder
+    :param duplicates: (output path, store key) pairs from `ImageWriter`
+    :return: Void
+    """
+
+    def record(data):
+        entries = data.setdefault('duplicates', {})
+        for path, key in duplicates:
+            entries[path.relative_to(folder).as_posix()] = key
+
+    Manifest(folder / MANIFEST_NAME).update(record)
+
+
+def next_run(root: Path) -> int:
+    """
+    Get the number of the next screenshot run for a media folder.
+
+    The count is stored in a sidecar in `root`. Folders that don't have one yet are scanned once
+    for existing screenshot folders.
+
+    :param root: Folder containing the media files
+    :return: Run number, starting at 1
+    """
+
+    def increment(data):
+        if 'runs' not in data:
+            data['runs'] = sum(1 for d in root.iterdir() if d.is_dir() and 'screens' in d.stem)
+        data['runs'] += 1
+        return data['runs']
+
+    return Manifest(root / RUNS_NAME).update(increment)
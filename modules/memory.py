@@ -0,0 +1,105 @@
+from contextlib import contextmanager
+from typing import NamedTuple
+
+import vapoursynth as vs
+
+core = vs.core
+
+# Frame cache size of a fresh core, in MB. Read once, since runs change it on the shared core
+DEFAULT_CACHE_MB = core.max_cache_size
+
+# Frames alive per request besides the output: the decoded frame and one filter intermediate
+FILTER_COPIES = 2
+
+
+class MemoryPlan(NamedTuple):
+    in_flight: int
+    queue_size: int
+    cache_mb: int
+    groups: list[list[int]]
+
+
+def frame_bytes(clip: vs.VideoNode) -> int:
+    """
+    Estimate the size of one frame of a clip from its format and dimensions.
+    :param clip: Clip with a constant format
+    :return: Bytes per frame
+    """
+
+    fmt = clip.format
+    luma = clip.width * clip.height * fmt.bytes_per_sample
+    chroma = luma >> (fmt.subsampling_w + fmt.subsampling_h)
+
+    return luma + chroma * (fmt.num_planes - 1)
+
+
+def request_bytes(clip: vs.VideoNode, image_height: int = None) -> int:
+    """
+    Estimate the memory held while a frame of a clip is being rendered: the decoded and filtered
+    frames, the RGB frame and the BGR array it is copied into.
+    :param clip: Prepared clip, before RGB conversion
+    :param image_height: Height of the rendered image, if it differs from the clip (e.g. stacked overlays)
+    :return: Bytes per frame in flight
+    """
+
+    image = clip.width * (image_height or clip.height) * 3
+
+    return frame_bytes(clip) * FILTER_COPIES + image * 2
+
+
+def plan_memory(clips: list[vs.VideoNode],
+                budget: int,
+                in_flight: int = None,
+                writers: int = 1,
+                stacked: bool = False,
+                cache_size: int = None) -> MemoryPlan:
+    """
+    Fit rendering into a memory budget.
+
+    A quarter of the budget is left to the VapourSynth frame cache. The rest is split between
+    frames in flight and images waiting for the encoder, each sized from the largest clip. When
+    the budget doesn't have room for a frame of every clip at once, clips are rendered in groups,
+    one group after another.
+
+    :param clips: Prepared clips, before RGB conversion
+    :param budget: Memory budget in bytes
+    :param in_flight: Requested maximum number of frames rendered at once. Default is `core.num_threads`
+    :param writers: Number of encoder threads or processes. Each holds one image while encoding
+    :param stacked: Boolean indicating if clean and overlay frames are rendered stacked, doubling the image height
+    :param cache_size: Configured frame cache size in MB, which the plan never exceeds. Default is the VapourSynth default
+    :return: Frames in flight, encoder queue size, cache size in MB and clip groups that fit the budget
+    """
+
+    mb = 1024 ** 2
+    cache_mb = max(1, min(cache_size or DEFAULT_CACHE_MB, budget // 4 // mb))
+    per_request = max(request_bytes(c, c.height * 2 if stacked else None) for c in clips)
+    per_image = max(c.width * c.height * 3 * (2 if stacked else 1) for c in clips)
+
+    available = budget - cache_mb * mb - writers * per_image
+    # Keep at least one frame in flight and one queued image, even if the budget is too small
+    frames = max(1, available // (per_request + per_image))
+    in_flight = max(1, min(in_flight or core.num_threads, frames))
+    queue_size = max(1, min(writers * 2, (available - in_flight * per_request) // per_image))
+
+    # Only split clips when the budget can't hold a frame of each at once, not when fewer frames are requested
+    size = frames if frames < len(clips) else len(clips)
+    groups = [list(range(i, min(i + size, len(clips)))) for i in range(0, len(clips), size)]
+
+    return MemoryPlan(in_flight, queue_size, cache_mb, groups)
+
+
+@contextmanager
+def cache_limit(cache_mb: int = None):
+    """
+    Limit the VapourSynth frame cache while the block runs, then restore the previous limit, so a
+    run's plan doesn't shrink the cache of later runs sharing the core.
+    :param cache_mb: Frame cache size in MB. If not passed, the cache is left alone
+    """
+
+    previous = core.max_cache_size
+    if cache_mb:
+        core.max_cache_size = cache_mb
+    try:
+        yield
+    finally:
+        core.max_cache_size = previous
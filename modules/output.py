@@ -0,0 +1,231 @@
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable
+
+import vapoursynth as vs
+
+from .dedup import ImageStore, link_file, write_file
+from .encoder import ProcessEncoder
+from .render import encode_image, frame_to_array
+from .report import RunReport
+from .trace import Trace, span
+
+if TYPE_CHECKING:
+    import numpy as np
+
+
+class ImageWriter:
+    """
+    Thread pool that encodes and writes images in the background.
+
+    Images are handed to the pool through a bounded queue, so rendering can keep producing frames
+    while earlier frames are compressed. When the queue is full, `submit` blocks until a worker
+    frees a slot, which keeps memory usage bounded when encoding is slower than rendering.
+
+    With encoder processes, each thread hands its image to a process through shared memory and
+    writes the result, so encoding runs outside the GIL. Frames converted with `frame_to_array` are
+    written straight into shared memory, and must be passed to `release` once every image cut from
+    them is submitted.
+    """
+
+    def __init__(self,
+                 workers: int = None,
+                 queue_size: int = None,
+                 params: list[int] = None,
+                 report: RunReport = None,
+                 trace: Trace = None,
+                 sink=None,
+                 store: ImageStore = None,
+                 processes: int = None):
+        """
+        :param workers: Number of encoder threads. Default is half the CPU count
+        :param queue_size: Maximum number of images waiting to be encoded. Default is twice the worker count
+        :param params: Encoder parameters from `encode_params`. The format is picked from each output path
+        :param report: Run report used to record encode time and size of each image
+        :param trace: Trace used to record a span for each image written
+        :param sink: Sink images are written to, from `open_sink`. Default writes each image to its path
+        :param store: Store of previously encoded images. Images found in it are linked instead of encoded
+        :param processes: Number of encoder processes. Images are passed to them through shared memory and
+            `workers` is ignored. Default encodes in threads
+        """
+
+        self.workers = processes or workers or max(1, (os.cpu_count() or 2) // 2)
+        self.queue = queue.Queue(maxsize=queue_size or self.workers * 2)
+        # Every queued image, every image being encoded and the frame being converted can hold a frame slot
+        self.encoder = None
+        if processes:
+            self.encoder = ProcessEncoder(processes, frame_slots=self.queue.maxsize + self.workers + 1)
+        self.params = params
+        self.report = report
+        self.trace = trace
+        self.sink = sink
+        self.store = store
+        self.lock = threading.Lock()
+        self.error = None
+
+        # Stage statistics
+        self.frames = 0
+        self.bytes_written = 0
+        self.duplicates = []
+        self.encode_seconds = 0.0
+        self.blocked_seconds = 0.0
+        self.start = time.perf_counter()
+        self.end = None
+
+        self.threads = [
+            threading.Thread(target=self._work, name=f"writer-{i}", daemon=True) for i in range(self.workers)
+        ]
+        for t in self.threads:
+            t.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(raise_errors=exc_type is None)
+
+    def _work(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            image, path, done, meta = item
+            try:
+                if path is None:
+                    # Task queued with `run`
+                    done(image)
+                    continue
+                start = time.perf_counter()
+                with span(self.trace, 'write', file=path.name):
+                    key = stored = None
+                    if self.store:
+                        key = self.store.key(image, path.suffix, self.params)
+                        stored = self.store.find(key, path.suffix)
+                    if stored:
+                        meta = {**(meta or {}), 'duplicate_of': key}
+                        size = self.sink.link(path, stored, meta) if self.sink else link_file(stored, path)
+                    else:
+                        encode = self.encoder.encode if self.encoder else encode_image
+                        data = encode(image, path.suffix, self.params)
+                        size = self.sink.write(path, data, meta) if self.sink else write_file(path, data)
+                        if key:
+                            files = getattr(self.sink, 'files', True)
+                            self.store.add(key, path.suffix, data, path if files else None)
+                elapsed = time.perf_counter() - start
+                with self.lock:
+                    self.frames += 1
+                    self.bytes_written += size
+                    self.encode_seconds += elapsed
+                    if stored:
+                        self.duplicates.append((path, key))
+                if self.report:
+                    self.report.add_image(elapsed, size, duplicate=bool(stored))
+                if done:
+                    done(self.sink.location(path) if self.sink else {'path': str(path)})
+            except Exception as e:
+                with self.lock:
+                    if not self.error:
+                        self.error = e
+            finally:
+                self.release(image)
+
+    def submit(self,
+               image: 'np.ndarray',
+               path: Path,
+               done: Callable[[dict], None] = None,
+               meta: dict = None) -> None:
+        """
+        Queue an image for encoding. Blocks while the queue is full.
+        :param image: BGR image array
+        :param path: Output path. The format is picked from its suffix
+        :param done: Function called once the image is written, with its 'path', or its 'archive' and 'entry' name
+        :param meta: Clip, tag and frame of the image, recorded by archive sinks. Duplicates also record their store key
+        :return: Void
+        """
+
+        if self.error:
+            raise self.error
+
+        if self.encoder:
+            self.encoder.hold(image)
+        start = time.perf_counter()
+        with span(self.trace, 'writer_queue_wait'):
+            self.queue.put((image, path, done, meta))
+        self.blocked_seconds += time.perf_counter() - start
+
+    def run(self, task: Callable[['np.ndarray'], None], image: 'np.ndarray') -> None:
+        """
+        Queue a task that uses an image, such as caching it, so it runs on a worker instead of the
+        caller's thread. The image is held until the task is done. Blocks while the queue is full.
+        :param task: Function called with the image
+        :param image: Image array
+        :return: Void
+        """
+
+        if self.error:
+            raise self.error
+
+        if self.encoder:
+            self.encoder.hold(image)
+        start = time.perf_counter()
+        with span(self.trace, 'writer_queue_wait'):
+            self.queue.put((image, None, task, None))
+        self.blocked_seconds += time.perf_counter() - start
+
+    def frame_to_array(self, frame: vs.VideoFrame) -> 'np.ndarray':
+        """
+        Convert an RGB frame into a BGR image array. With encoder processes, the planes are written
+        straight into shared memory, so the image isn't copied again before encoding.
+        Pass the array to `release` once every image cut from it is submitted.
+        :param frame: RGB VideoFrame
+        :return: BGR image array
+        """
+
+        return self.encoder.frame_to_array(frame) if self.encoder else frame_to_array(frame)
+
+    def release(self, image: 'np.ndarray') -> None:
+        """
+        Drop a hold on the shared memory an image was converted into. Does nothing without encoder processes.
+        :param image: Image array from `frame_to_array`, or any image cut from it
+        :return: Void
+        """
+
+        if self.encoder:
+            self.encoder.release(image)
+
+    def close(self, raise_errors: bool = True) -> None:
+        """
+        Wait for all queued images to be written and stop the workers.
+        :param raise_errors: Re-raise the first error hit by a worker
+        :return: Void
+        """
+
+        for _ in self.threads:
+            self.queue.put(None)
+        for t in self.threads:
+            t.join()
+        if self.encoder:
+            self.encoder.close()
+        self.end = time.perf_counter()
+
+        if raise_errors and self.error:
+            raise self.error
+
+    def summary(self) -> str:
+        """
+        Summarize encoder throughput.
+        :return: Printable summary
+        """
+
+        wall = (self.end or time.perf_counter()) - self.start
+        per_frame = self.encode_seconds / self.frames * 1000 if self.frames else 0
+        per_image = self.bytes_written / self.frames / 1024 if self.frames else 0
+        return (
+            f"Encode: {self.frames} images in {wall:.2f}s ({self.frames / wall if wall else 0:.2f} fps) "
+            f"using {self.workers} {'processes' if self.encoder else 'threads'}, {per_frame:.0f} ms/image, {per_image:.0f} KiB/image, "
+            f"{self.bytes_written / 1024 ** 2:.1f} MiB written"
+            + (f", {len(self.duplicates)} duplicates linked from the image store" if self.store else '')
+        )
@@ -0,0 +1,83 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+class ClipPool:
+    """
+    In-memory LRU pool of prepared clips, kept by a long-running process between runs.
+
+    Entries are keyed by the settings used to build them, including each file's fingerprint, so
+    a file that changed on disk is loaded again. Evicting an entry drops the only reference to its
+    graph, which lets VapourSynth free its decoders and cached frames.
+    """
+
+    def __init__(self, max_size: int = 4):
+        """
+        :param max_size: Maximum number of prepared jobs kept
+        """
+
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.used = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(**settings) -> str:
+        """
+        Build a pool key from the settings that decide how clips are prepared.
+        :param settings: JSON serializable settings
+        :return: Pool key
+        """
+
+        return json.dumps(settings, sort_keys=True, default=str)
+
+    def get(self, key: str):
+        """
+        Get a prepared job and mark it as recently used.
+        :param key: Key returned by `key`
+        :return: Prepared job, or None if it isn't pooled
+        """
+
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+            self.used[key] = time.time()
+            return self.entries[key]
+
+    def put(self, key: str, value) -> None:
+        """
+        Add a prepared job, evicting the least recently used jobs if the pool is full.
+        :param key: Key returned by `key`
+        :param value: Prepared job
+        :return: Void
+        """
+
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            self.used[key] = time.time()
+            while len(self.entries) > self.max_size:
+                evicted, _ = self.entries.popitem(last=False)
+                self.used.pop(evicted, None)
+
+    def summary(self) -> dict:
+        """
+        Summarize the pool.
+        :return: Pool size, hit/miss counts and when each entry was last used
+        """
+
+        with self.lock:
+            return {
+                'size': len(self.entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'entries': [{'key': json.loads(k), 'last_used': self.used.get(k)} for k in self.entries]
+            }
@@ -0,0 +1,81 @@
+import json
+import threading
+from pathlib import Path
+
+import vapoursynth as vs
+
+from .cache import default_cache_dir, fingerprint
+
+# Transfer characteristics used by HDR content (PQ and HLG)
+HDR_TRANSFERS = (16, 18)
+
+
+def probe_clip(clip: vs.VideoNode) -> dict:
+    """
+    Read the metadata of a freshly loaded clip. Decodes the first frame once.
+    :param clip: Source clip returned by the load filter
+    :return: Dictionary of clip metadata
+    """
+
+    props = clip.get_frame(0).props
+    transfer = props.get('_Transfer', 2)
+
+    return {
+        'width': clip.width,
+        'height': clip.height,
+        'format': clip.format.name,
+        'num_frames': clip.num_frames,
+        'fps': [clip.fps.numerator, clip.fps.denominator],
+        'matrix': props.get('_Matrix', 2),
+        'transfer': transfer,
+        'primaries': props.get('_Primaries', 2),
+        'range': props.get('_ColorRange', 1),
+        'hdr': transfer in HDR_TRANSFERS or 'MasteringDisplayMaxLuminance' in props,
+        'dovi': 'DolbyVisionRPU' in props,
+        'hdr10plus': any(k.startswith('HDR10Plus') for k in props.keys())
+    }
+
+
+class ProbeCache:
+    """
+    On-disk cache of clip metadata, stored next to the index cache.
+
+    Each file is probed once and the result is keyed by the file's fingerprint, so later runs (and
+    later stages of the same run) read the matrix, transfer, frame count, etc. without decoding a
+    frame.
+    """
+
+    def __init__(self, root: Path = None):
+        """
+        :param root: Cache directory. Default is the platform cache directory
+        """
+
+        self.root = Path(root or default_cache_dir() / 'probe')
+        self.lock = threading.Lock()
+        self.memo = {}
+
+    def get(self, clip: vs.VideoNode, file: Path, load_filter: str = 'ffms2') -> dict:
+        """
+        Get the metadata for a clip, probing it if it isn't cached.
+        :param clip: Source clip loaded from `file`
+        :param file: Path to the media file
+        :param load_filter: Filter used to load the clip. Frame counts can differ between filters
+        :return: Dictionary of clip metadata
+        """
+
+        path = self.root / f"{fingerprint(file)}-{load_filter}.json"
+        with self.lock:
+            if path in self.memo:
+                return self.memo[path]
+
+        try:
+            metadata = json.loads(path.read_text())
+        except (OSError, ValueError):
+            metadata = probe_clip(clip)
+            self.root.mkdir(parents=True, exist_ok=True)
+            path.write_text(json.dumps(metadata))
+
+        with self.lock:
+            self.memo[path] = metadata
+
+        return metadata
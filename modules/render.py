@@ -0,0 +1,236 @@
+import vapoursynth as vs
+
+from collections import Counter, deque
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+from functools import partial
+from typing import TYPE_CHECKING, Callable, NamedTuple
+
+from .report import RunReport
+from .trace import Trace
+
+# numpy and OpenCV are imported inside the functions that use them, here and in the other modules,
+# so the CLI starts without them
+if TYPE_CHECKING:
+    import numpy as np
+
+core = vs.core
+
+# Images that can be saved from each rendered frame
+VARIANTS = ('overlay', 'clean', 'roi', 'thumb')
+# Output formats and their file suffixes
+IMAGE_FORMATS = {
+    'png': '.png',
+    'webp': '.webp',
+    'jpg': '.jpg',
+    'ppm': '.ppm'
+}
+
+
+class FrameRequest(NamedTuple):
+    """A single (clip, frame) pair to render."""
+    clip: int
+    frame: int
+    index: int
+    tag: str
+
+
+def screenshot_requests(frame_lists: list[list[int]], tags: list[str]) -> list[FrameRequest]:
+    """
+    Build render requests for every (clip, frame) pair.
+
+    Requests are interleaved by screenshot number so that every clip is rendered at the same time
+    instead of one clip after another.
+
+    :param frame_lists: Frames to render for each clip. Must match the order of the clips
+    :param tags: Tag for each clip, used when naming the output images
+    :return: List of frame requests
+    """
+
+    if len(frame_lists) != len(tags):
+        raise ValueError("The number of frame lists does not match the number of tags")
+
+    requests = []
+    for index in range(max(len(f) for f in frame_lists)):
+        for clip, frames in enumerate(frame_lists):
+            if index < len(frames):
+                requests.append(FrameRequest(clip, frames[index], index + 1, tags[clip]))
+
+    return requests
+
+
+def to_rgb(clip: vs.VideoNode, matrix: int = None) -> vs.VideoNode:
+    """
+    Convert a clip to RGB24 for output, mirroring the conversion used by ScreenGen.
+    :param clip: Clip to convert
+    :param matrix: Matrix coefficients of the clip. If not passed, frame 0 is decoded to read them
+    :return: RGB24 clip
+    """
+
+    if clip.format.color_family == vs.RGB:
+        return clip.resize.Spline36(format=vs.RGB24, dither_type='error_diffusion')
+
+    if matrix is None:
+        matrix = clip.get_frame(0).props.get('_Matrix', 1)
+    if matrix == 2:
+        matrix = 1
+
+    return clip.resize.Spline36(format=vs.RGB24, matrix_in=matrix, dither_type='error_diffusion')
+
+
+def frame_to_array(frame: vs.VideoFrame) -> 'np.ndarray':
+    """
+    Copy an RGB frame into a packed BGR array for OpenCV.
+    :param frame: RGB VideoFrame
+    :return: BGR image array
+    """
+
+    import numpy as np
+
+    return np.dstack([np.asarray(frame[p]) for p in (2, 1, 0)])
+
+
+def roi_crop(image: 'np.ndarray', x: int, y: int, width: int, height: int, scale: int = 2) -> 'np.ndarray':
+    """
+    Crop a region of an image and enlarge it with nearest-neighbour scaling, so pixels stay sharp.
+    :param image: Image array
+    :param x: Left edge of the region
+    :param y: Top edge of the region
+    :param width: Region width
+    :param height: Region height
+    :param scale: Integer scale factor
+    :return: Enlarged region
+    """
+
+    import numpy as np
+
+    crop = image[y:y + height, x:x + width]
+    return np.repeat(np.repeat(crop, scale, axis=0), scale, axis=1)
+
+
+def thumbnail(image: 'np.ndarray', width: int) -> 'np.ndarray':
+    """
+    Downscale an image to a width, keeping its aspect ratio.
+    :param image: Image array
+    :param width: Thumbnail width
+    :return: Downscaled image
+    """
+
+    import cv2
+
+    height = max(1, round(image.shape[0] * width / image.shape[1]))
+    return cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+
+
+def render_frames(clips: list[vs.VideoNode],
+                  requests: list[FrameRequest],
+                  callback: Callable[[FrameRequest, vs.VideoFrame], None],
+                  max_in_flight: int = None,
+                  max_per_clip: int = None,
+                  report: RunReport = None,
+                  trace: Trace = None) -> None:
+
+    """
+    Render frames from all clips concurrently.
+
+    Frames are requested with `get_frame_async` for every request across all clips, while capping
+    the number of frames in flight so the core's thread pool stays busy without rendering every
+    frame at once. Finished frames are passed to `callback` on the calling thread.
+
+    Requests for each clip are issued in the order given. When `max_per_clip` is set, a clip with
+    that many frames in flight is skipped until one finishes, so a decoder works through its
+    frames in order instead of serving them all at once.
+
+    :param clips: Clips to render from. Indexed by `FrameRequest.clip`
+    :param requests: Frames to render, in the order they should be requested
+    :param callback: Function called with the request and its rendered frame
+    :param max_in_flight: Maximum number of frames requested at once. Default is `core.num_threads`
+    :param max_per_clip: Maximum number of frames requested at once from a single clip. Default is unlimited
+    :param report: Run report used to record the latency of each frame
+    :param trace: Trace used to record a span for each frame request
+    :return: Void
+    """
+
+    if not max_in_flight:
+        max_in_flight = core.num_threads
+
+    queue = deque(requests)
+    pending = {}
+    per_clip = Counter()
+
+    def record_latency(clip, start, _):
+        report.add_frame(clip, time.perf_counter() - start)
+
+    def end_span(span_id, name, group, _):
+        trace.end_async(span_id, name, group)
+
+    while queue or pending:
+        held = []
+        while queue and len(pending) < max_in_flight:
+            request = queue.popleft()
+            if max_per_clip and per_clip[request.clip] >= max_per_clip:
+                held.append(request)
+                continue
+            start = time.perf_counter()
+            if trace:
+                name, group = f"get_frame {request.frame}", f"clip {request.clip}"
+                span_id = trace.begin_async(name, group, clip=request.clip, frame=request.frame)
+            future = clips[request.clip].get_frame_async(request.frame)
+            if report:
+                # Record when the frame is ready, not when this thread gets around to it
+                future.add_done_callback(partial(record_latency, request.clip, start))
+            if trace:
+                future.add_done_callback(partial(end_span, span_id, name, group))
+            pending[future] = request
+            per_clip[request.clip] += 1
+        queue.extendleft(reversed(held))
+
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            request = pending.pop(future)
+            per_clip[request.clip] -= 1
+            callback(request, future.result())
+        # Release finished frames before requesting more
+        done = future = None
+
+
+def encode_params(image_format: str = 'png', compression: int = 9, quality: int = 95) -> list[int]:
+    """
+    Get the OpenCV encoder parameters for an output format.
+    :param image_format: One of IMAGE_FORMATS
+    :param compression: zlib compression level (0-9) used for PNG
+    :param quality: Quality (0-100) used for JPEG
+    :return: Parameters for `cv2.imencode`
+    """
+
+    import cv2
+
+    if image_format == 'png':
+        return [cv2.IMWRITE_PNG_COMPRESSION, compression]
+    elif image_format == 'jpg':
+        return [cv2.IMWRITE_JPEG_QUALITY, quality]
+    elif image_format == 'webp':
+        # Quality above 100 selects lossless WebP
+        return [cv2.IMWRITE_WEBP_QUALITY, 101]
+    elif image_format == 'ppm':
+        return [cv2.IMWRITE_PXM_BINARY, 1]
+    else:
+        raise ValueError(f"Unknown image format '{image_format}'. Options are {', '.join(IMAGE_FORMATS)}")
+
+
+def encode_image(image: 'np.ndarray', suffix: str = '.png', params: list[int] = None) -> bytes:
+    """
+    Encode an image.
+    :param image: BGR image array
+    :param suffix: File suffix of the output format, such as '.png'
+    :param params: Encoder parameters from `encode_params`
+    :return: Encoded image
+    """
+
+    import cv2
+
+    ok, buffer = cv2.imencode(suffix, image, params or [])
+    if not ok:
+        raise RuntimeError(f"Failed to encode image as '{suffix}'")
+
+    return buffer.tobytes()
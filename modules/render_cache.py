@@ -0,0 +1,144 @@
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from .cache import DEFAULT_CACHE_SIZE, default_cache_dir, evict_lru
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# Bump when a change to the filter graph changes the rendered pixels, so stale frames are never reused
+CACHE_VERSION = 1
+
+
+class RenderCache:
+    """
+    Persistent cache of rendered RGB frames, shared across runs.
+
+    Frames are keyed by a hash of the clip's pipeline settings (file fingerprint, crop, resize
+    kernel, tonemapping, overlay, etc.) and the source frame number, so regenerating screenshots
+    of the same frames with the same settings skips decoding and filtering entirely. Frames are
+    stored uncompressed so reading one back is cheaper than rendering it, and the least recently
+    used frames are evicted when the cache exceeds its size limit.
+    """
+
+    def __init__(self, root: Path = None, max_size: int = DEFAULT_CACHE_SIZE):
+        """
+        :param root: Cache directory. Default is the platform cache directory
+        :param max_size: Maximum total size of cached frames, in bytes
+        """
+
+        self.root = Path(root or default_cache_dir() / 'render')
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.used = set()
+        self.hits = 0
+        self.misses = 0
+        self.bytes_read = 0
+        self.bytes_stored = 0
+
+    def __reduce__(self):
+        return self.__class__, (self.root, self.max_size)
+
+    @staticmethod
+    def key(**settings) -> str:
+        """
+        Hash the settings that decide what a clip's frames look like.
+        :param settings: JSON serializable pipeline settings
+        :return: Hex digest identifying the clip's pipeline
+        """
+
+        settings = json.dumps({'version': CACHE_VERSION, **settings}, sort_keys=True, default=str)
+        return hashlib.blake2b(settings.encode(), digest_size=16).hexdigest()
+
+    def path(self, key: str, frame: int) -> Path:
+        return self.root / key[:2] / f"{key}-{frame}.npy"
+
+    def get(self, key: str, frame: int) -> 'np.ndarray | None':
+        """
+        Read a rendered frame. Hits are marked as recently used.
+        :param key: Pipeline key returned by `key`
+        :param frame: Source frame number
+        :return: BGR image array, or None if the frame isn't cached
+        """
+
+        import numpy as np
+
+        path = self.path(key, frame)
+        try:
+            image = np.load(path)
+            os.utime(path)
+        except FileNotFoundError:
+            image = None
+        except (OSError, ValueError):
+            print(f"Discarding unreadable cached frame '{path.name}'")
+            path.unlink(missing_ok=True)
+            image = None
+
+        with self.lock:
+            if image is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.bytes_read += image.nbytes
+                self.used.add(path)
+
+        return image
+
+    def put(self, key: str, frame: int, image: 'np.ndarray') -> None:
+        """
+        Store a rendered frame.
+        :param key: Pipeline key returned by `key`
+        :param frame: Source frame number
+        :param image: BGR image array
+        :return: Void
+        """
+
+        import numpy as np
+
+        path = self.path(key, frame)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp, 'wb') as f:
+            np.save(f, image)
+        os.replace(tmp, path)
+
+        with self.lock:
+            self.bytes_stored += image.nbytes
+            self.used.add(path)
+
+    def evict(self) -> None:
+        """
+        Delete the least recently used frames until the cache fits within its size limit.
+        Frames used by this process are never evicted.
+        :return: Void
+        """
+
+        if not self.root.exists():
+            return
+
+        entries = []
+        for path in self.root.glob('*/*.npy'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, [path]))
+
+        evict_lru(entries, self.max_size, self.used)
+
+    def summary(self) -> str:
+        """
+        Summarize cache usage.
+        :return: Printable summary
+        """
+
+        lookups = self.hits + self.misses
+        return (
+            f"Render cache: {self.hits} hits, {self.misses} misses "
+            f"({self.hits / lookups * 100 if lookups else 0:.0f}% hit rate), "
+            f"{self.bytes_read / 1024 ** 2:.1f} MiB read, {self.bytes_stored / 1024 ** 2:.1f} MiB stored"
+        )
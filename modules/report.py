@@ -0,0 +1,167 @@
+import json
+import math
+import platform
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timezone
+from pathlib import Path
+
+import vapoursynth as vs
+
+
+def percentiles(values: list[float]) -> dict:
+    """
+    Summarize a list of timings.
+    :param values: Timings in seconds
+    :return: Mean, p50, p90, p95, p99 and max in milliseconds
+    """
+
+    if not values:
+        return {}
+
+    ordered = sorted(values)
+
+    def rank(p):
+        return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)] * 1000
+
+    return {
+        'mean': sum(ordered) / len(ordered) * 1000,
+        'p50': rank(50),
+        'p90': rank(90),
+        'p95': rank(95),
+        'p99': rank(99),
+        'max': ordered[-1] * 1000
+    }
+
+
+def stage(report, name: str):
+    """
+    Time a stage if a report is being collected.
+    :param report: RunReport, or None
+    :param name: Stage name
+    :return: Context manager
+    """
+
+    return report.stage(name) if report else nullcontext()
+
+
+class RunReport:
+    """
+    Collects per-stage and per-frame timings for a run and writes them as JSON.
+
+    Stage timings are wall-clock seconds spent in each step of the pipeline. Stages named `graph_*`
+    only build the lazy filter graph, so they don't include any rendering. Frame latencies are
+    measured from the moment a frame is requested until it is delivered, so they include decoding
+    and every filter in the graph. Per-filter render times are added with `set_filters`.
+    """
+
+    def __init__(self):
+        self.started = datetime.now(timezone.utc)
+        self.start = time.perf_counter()
+        self.lock = threading.Lock()
+        self.stages = {}
+        self.latencies = {}
+        self.clips = []
+        self.encode_times = []
+        self.bytes_written = 0
+        self.duplicates = 0
+        self.filters = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Time a block of code. Timings for repeated stages are summed.
+        :param name: Stage name
+        """
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage(name, time.perf_counter() - start)
+
+    def add_stage(self, name: str, seconds: float) -> None:
+        with self.lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def add_frame(self, clip: int, seconds: float) -> None:
+        with self.lock:
+            self.latencies.setdefault(clip, []).append(seconds)
+
+    def add_image(self, seconds: float, size: int, duplicate: bool = False) -> None:
+        with self.lock:
+            self.encode_times.append(seconds)
+            self.bytes_written += size
+            self.duplicates += duplicate
+
+    def set_clips(self, files: list[Path]) -> None:
+        """
+        Label clips in the report.
+        :param files: Media file for each clip
+        :return: Void
+        """
+
+        self.clips = [{'file': str(f)} for f in files]
+
+    def set_tags(self, tags: list[str]) -> None:
+        """
+        Record the tag used for each clip's screenshots.
+        :param tags: Tag for each clip
+        :return: Void
+        """
+
+        self.clips = [{**c, 'tag': t} for c, t in zip(self.clips or [{} for _ in tags], tags)]
+
+    def set_filters(self, summary: dict) -> None:
+        """
+        Record per-stage filter timings for each clip.
+        :param summary: Summary returned by `GraphProfiler.summary`
+        :return: Void
+        """
+
+        self.filters = summary
+
+    def to_dict(self) -> dict:
+        try:
+            plugins = {p.namespace: getattr(p, 'version', None) for p in vs.core.plugins()}
+        except (AttributeError, vs.Error):
+            plugins = {}
+
+        clips = []
+        for i, clip in enumerate(self.clips or [{} for _ in self.latencies]):
+            latencies = self.latencies.get(i, [])
+            clips.append({**clip, 'frames': len(latencies), 'latency_ms': percentiles(latencies)})
+            if i in self.filters:
+                clips[-1]['filters_ms'] = self.filters[i]
+
+        return {
+            'started': self.started.isoformat(),
+            'duration': time.perf_counter() - self.start,
+            'host': platform.node(),
+            'python': platform.python_version(),
+            'vapoursynth': vs.core.version_number(),
+            'plugins': plugins,
+            'threads': vs.core.num_threads,
+            'stages': self.stages,
+            'clips': clips,
+            'output': {
+                'images': len(self.encode_times),
+                'bytes': self.bytes_written,
+                'bytes_per_image': self.bytes_written / len(self.encode_times) if self.encode_times else 0,
+                'duplicates': self.duplicates,
+                'encode_ms': percentiles(self.encode_times)
+            }
+        }
+
+    def write(self, path: Path) -> None:
+        """
+        Write the report as JSON.
+        :param path: Output path
+        :return: Void
+        """
+
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(self.to_dict(), indent=2))
+        print(f"Run report saved to '{path}'")
@@ -0,0 +1,115 @@
+from bisect import bisect_right
+from itertools import zip_longest
+from pathlib import Path
+
+from .render import FrameRequest
+
+# Frames further apart than this are assumed to be in different GOPs when keyframes are unknown
+DEFAULT_GOP_SIZE = 250
+
+
+def read_keyframes(index: Path) -> list[int] | None:
+    """
+    Read keyframe positions from a source index.
+
+    Only L-SMASH Works (.lwi) indexes are plain text and can be parsed. Keyframes are counted
+    in decode order, which is close enough to presentation order to group frames by GOP.
+
+    :param index: Path to the index file
+    :return: Sorted keyframe numbers, or None if they could not be read
+    """
+
+    if index.suffix != '.lwi' or not index.exists():
+        return None
+
+    keyframes = []
+    frame = 0
+    stream = None
+    current = None
+    try:
+        with open(index, 'r', errors='ignore') as f:
+            for line in f:
+                if line.startswith('Index='):
+                    current = line[6:line.find(',')]
+                # Only video entries carry a 'Key=' line. Use the first video stream
+                elif line.startswith('Key='):
+                    if stream is None:
+                        stream = current
+                    if current != stream:
+                        continue
+                    if line[4] == '1':
+                        keyframes.append(frame)
+                    frame += 1
+    except OSError:
+        return None
+
+    return keyframes or None
+
+
+def group_frames(frames: list[int],
+                 keyframes: list[int] = None,
+                 gop_size: int = DEFAULT_GOP_SIZE) -> list[list[int]]:
+
+    """
+    Group frames that share a GOP.
+
+    When keyframes are known, frames are grouped by the keyframe preceding them. Otherwise, frames
+    no more than `gop_size` apart are assumed to share a GOP.
+
+    :param frames: Frames to group
+    :param keyframes: Sorted keyframe numbers from the source index
+    :param gop_size: Maximum distance between frames in a group when keyframes are unknown
+    :return: Groups of ascending frames, in ascending order
+    """
+
+    groups = []
+    last_key = None
+    for frame in sorted(frames):
+        if keyframes:
+            key = keyframes[bisect_right(keyframes, frame) - 1] if frame >= keyframes[0] else 0
+            new_group = key != last_key
+            last_key = key
+        else:
+            new_group = not groups or frame - groups[-1][-1] > gop_size
+        if new_group:
+            groups.append([frame])
+        else:
+            groups[-1].append(frame)
+
+    return groups
+
+
+def schedule_requests(requests: list[FrameRequest],
+                      keyframes: list[list[int] | None] = None,
+                      gop_size: int = DEFAULT_GOP_SIZE) -> list[FrameRequest]:
+
+    """
+    Order frame requests so each decoder reads forward through one GOP at a time.
+
+    Requests for each clip are grouped by GOP and sorted so frames in the same GOP are decoded
+    sequentially instead of each paying for a keyframe seek. Groups are then interleaved across
+    clips, so every clip is working through a GOP at the same time.
+
+    :param requests: Frame requests to schedule
+    :param keyframes: Keyframe numbers for each clip, or None for clips without a readable index
+    :param gop_size: Maximum distance between frames in a group when keyframes are unknown
+    :return: Scheduled requests
+    """
+
+    by_clip = {}
+    for request in requests:
+        by_clip.setdefault(request.clip, {}).setdefault(request.frame, []).append(request)
+
+    clip_groups = []
+    for clip, frames in by_clip.items():
+        keys = keyframes[clip] if keyframes else None
+        groups = group_frames(list(frames), keys, gop_size)
+        clip_groups.append([[r for f in group for r in frames[f]] for group in groups])
+
+    scheduled = []
+    for groups in zip_longest(*clip_groups):
+        for group in groups:
+            if group:
+                scheduled.extend(group)
+
+    return scheduled
@@ -0,0 +1,217 @@
+import io
+import json
+import tarfile
+import threading
+import time
+import zipfile
+from pathlib import Path
+
+from .dedup import link_file, write_file
+
+# Where images can be written
+SINKS = ('dir', 'tar', 'zip')
+
+
+class DirectorySink:
+    """
+    Writes each image to its own file, relative to the output folder.
+    """
+
+    # Images are written to their output paths
+    files = True
+
+    def __init__(self, root: Path):
+        """
+        :param root: Output folder
+        """
+
+        self.root = root
+        self.path = root
+        self.folders = set()
+
+    def write(self, path: Path, data: bytes, meta: dict = None) -> int:
+        """
+        Write an encoded image.
+        :param path: Output path inside the output folder
+        :param data: Encoded image
+        :param meta: Clip, tag and frame of the image. Unused for plain directories
+        :return: Number of bytes written
+        """
+
+        if path.parent not in self.folders:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self.folders.add(path.parent)
+
+        return write_file(path, data)
+
+    def link(self, path: Path, source: Path, meta: dict = None) -> int:
+        """
+        Write an image that was already encoded, by hardlinking it.
+        :param path: Output path inside the output folder
+        :param source: Existing encoded image
+        :param meta: Clip, tag and frame of the image. Unused for plain directories
+        :return: Number of bytes written
+        """
+
+        if path.parent not in self.folders:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self.folders.add(path.parent)
+
+        return link_file(source, path)
+
+    def location(self, path: Path) -> dict:
+        """
+        Describe where an image was written, for callers reporting saved images.
+        :param path: Output path inside the output folder
+        :return: Image path
+        """
+
+        return {'path': str(path)}
+
+    def close(self) -> None:
+        pass
+
+
+class ArchiveSink:
+    """
+    Base class for sinks that stream images into a single archive file.
+
+    Images are encoded in parallel but appended one at a time, since archives are written
+    sequentially. Each entry is recorded in a JSON index saved next to the archive with its clip,
+    tag, frame and position in the archive, so consumers can find an image without unpacking or
+    scanning the archive. Archives that already exist are appended to, so resumed runs add to them.
+    """
+
+    suffix = None
+    files = False
+
+    def __init__(self, root: Path, name: str):
+        """
+        :param root: Output folder. Image paths are stored relative to it
+        :param name: Archive file name, without suffix
+        """
+
+        self.root = root
+        self.path = root / f"{name}{self.suffix}"
+        self.index_path = self.path.with_name(self.path.name + '.index.json')
+        self.lock = threading.Lock()
+        self.entries = []
+        if self.path.exists() and self.index_path.exists():
+            self.entries = json.loads(self.index_path.read_text()).get('entries', [])
+        root.mkdir(parents=True, exist_ok=True)
+
+    def write(self, path: Path, data: bytes, meta: dict = None) -> int:
+        """
+        Append an encoded image to the archive.
+        :param path: Output path inside the output folder. Stored relative to it
+        :param data: Encoded image
+        :param meta: Clip, tag and frame of the image, recorded in the index
+        :return: Number of bytes written
+        """
+
+        name = path.relative_to(self.root).as_posix()
+        with self.lock:
+            offset = self._add(name, data)
+            self.entries.append({'name': name, 'offset': offset, 'size': len(data), **(meta or {})})
+
+        return len(data)
+
+    def link(self, path: Path, source: Path, meta: dict = None) -> int:
+        """
+        Append an image that was already encoded. Archives can't share data, so it is copied in.
+        :param path: Output path inside the output folder. Stored relative to it
+        :param source: Existing encoded image
+        :param meta: Clip, tag and frame of the image, recorded in the index
+        :return: Number of bytes written
+        """
+
+        return self.write(path, source.read_bytes(), meta)
+
+    def location(self, path: Path) -> dict:
+        """
+        Describe where an image was written, for callers reporting saved images.
+        :param path: Output path inside the output folder
+        :return: Archive path and the image's entry name in it
+        """
+
+        return {'archive': str(self.path), 'entry': path.relative_to(self.root).as_posix()}
+
+    def _add(self, name: str, data: bytes) -> int:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        with self.lock:
+            self._close()
+            self.index_path.write_text(json.dumps({
+                'archive': self.path.name,
+                'format': self.suffix.lstrip('.'),
+                'entries': self.entries
+            }, indent=2))
+        print(f"Archive saved to '{self.path}' ({len(self.entries)} images)")
+
+    def _close(self) -> None:
+        raise NotImplementedError
+
+
+class TarSink(ArchiveSink):
+    """
+    Streams images into an uncompressed tar archive. Index offsets point at each image's data.
+    """
+
+    suffix = '.tar'
+
+    def __init__(self, root: Path, name: str):
+        super().__init__(root, name)
+        self.tar = tarfile.open(self.path, 'a' if self.path.exists() else 'w', format=tarfile.PAX_FORMAT)
+
+    def _add(self, name: str, data: bytes) -> int:
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = int(time.time())
+        self.tar.addfile(info, io.BytesIO(data))
+        # Data is padded to whole blocks and ends where the archive offset now is
+        blocks = -(-len(data) // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+        return self.tar.offset - blocks
+
+    def _close(self) -> None:
+        self.tar.close()
+
+
+class ZipSink(ArchiveSink):
+    """
+    Streams images into a zip archive. Images are already compressed, so entries are stored as-is.
+    Index offsets point at each entry's local header.
+    """
+
+    suffix = '.zip'
+
+    def __init__(self, root: Path, name: str):
+        super().__init__(root, name)
+        self.zip = zipfile.ZipFile(self.path, 'a' if self.path.exists() else 'w', compression=zipfile.ZIP_STORED)
+
+    def _add(self, name: str, data: bytes) -> int:
+        info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+        self.zip.writestr(info, data)
+        return info.header_offset
+
+    def _close(self) -> None:
+        self.zip.close()
+
+
+def open_sink(kind: str, root: Path, name: str = 'screenshots'):
+    """
+    Create an output sink.
+    :param kind: One of SINKS
+    :param root: Output folder
+    :param name: Archive file name, without suffix. Unused for plain directories
+    :return: Sink
+    """
+
+    if kind == 'dir':
+        return DirectorySink(root)
+    elif kind == 'tar':
+        return TarSink(root, name)
+    elif kind == 'zip':
+        return ZipSink(root, name)
+    else:
+        raise ValueError(f"Unknown output sink '{kind}'. Options are {', '.join(SINKS)}")
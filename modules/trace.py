@@ -0,0 +1,165 @@
+import itertools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+
+
+def span(trace, name: str, **args):
+    """
+    Record a span if a trace is being collected.
+    :param trace: Trace, or None
+    :param name: Span name
+    :param args: Extra values shown with the span
+    :return: Context manager
+    """
+
+    return trace.span(name, **args) if trace else nullcontext()
+
+
+class Trace:
+    """
+    Collects timeline spans and writes them in Chrome trace-event format.
+
+    The output can be opened in Perfetto (https://ui.perfetto.dev) or `chrome://tracing`. Spans
+    on a thread are recorded as complete events on that thread's track. Frame requests overlap
+    each other, so they are recorded as async events grouped per clip instead.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter_ns()
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+        self.events = []
+        self.threads = {}
+        self.ids = itertools.count(1)
+        self.local = threading.local()
+        self.tids = itertools.count(1)
+
+    def now(self) -> int:
+        """
+        :return: Microseconds since the trace started
+        """
+
+        return (time.perf_counter_ns() - self.start) // 1000
+
+    def _tid(self) -> int:
+        # Thread idents are reused once a thread exits, so give each thread its own track instead
+        if not hasattr(self.local, 'tid'):
+            self.local.tid = next(self.tids)
+            self.threads[self.local.tid] = threading.current_thread().name
+        return self.local.tid
+
+    @contextmanager
+    def span(self, name: str, **args):
+        """
+        Record a block of code as a span on the current thread.
+        :param name: Span name
+        :param args: Extra values shown with the span
+        """
+
+        start = self.now()
+        try:
+            yield
+        finally:
+            self.add_span(name, start, self.now(), **args)
+
+    def add_span(self, name: str, start: int, end: int, **args) -> None:
+        """
+        Record a span on the current thread.
+        :param name: Span name
+        :param start: Start time from `now`
+        :param end: End time from `now`
+        :param args: Extra values shown with the span
+        :return: Void
+        """
+
+        with self.lock:
+            self.events.append({
+                'name': name, 'cat': 'stage', 'ph': 'X', 'ts': start, 'dur': end - start,
+                'pid': self.pid, 'tid': self._tid(), 'args': args
+            })
+
+    def timestamp(self, seconds: float) -> int:
+        """
+        :param seconds: Time from `time.perf_counter`
+        :return: Microseconds since the trace started
+        """
+
+        return (int(seconds * 1e9) - self.start) // 1000
+
+    def add_async(self, name: str, group: str, start: int, end: int, **args) -> None:
+        """
+        Record a finished span that may overlap others, e.g. one filter stage of a frame.
+        :param name: Span name
+        :param group: Track the span is drawn on, e.g. one per clip
+        :param start: Start time from `now` or `timestamp`
+        :param end: End time from `now` or `timestamp`
+        :param args: Extra values shown with the span
+        :return: Void
+        """
+
+        with self.lock:
+            span_id = next(self.ids)
+            self.events.append({
+                'name': name, 'cat': group, 'ph': 'b', 'id': span_id, 'ts': start,
+                'pid': self.pid, 'tid': self._tid(), 'args': args
+            })
+            self.events.append({
+                'name': name, 'cat': group, 'ph': 'e', 'id': span_id, 'ts': end,
+                'pid': self.pid, 'tid': self._tid(), 'args': {}
+            })
+
+    def begin_async(self, name: str, group: str, **args) -> int:
+        """
+        Start a span that may overlap others and finish on a different thread.
+        :param name: Span name
+        :param group: Track the span is drawn on, e.g. one per clip
+        :param args: Extra values shown with the span
+        :return: Span ID passed to `end_async`
+        """
+
+        with self.lock:
+            span_id = next(self.ids)
+            self.events.append({
+                'name': name, 'cat': group, 'ph': 'b', 'id': span_id, 'ts': self.now(),
+                'pid': self.pid, 'tid': self._tid(), 'args': {**args, 'requested_by': self._tid()}
+            })
+
+        return span_id
+
+    def end_async(self, span_id: int, name: str, group: str) -> None:
+        """
+        Finish a span started with `begin_async`. Records the thread it finished on.
+        :param span_id: ID returned by `begin_async`
+        :param name: Span name
+        :param group: Track passed to `begin_async`
+        :return: Void
+        """
+
+        with self.lock:
+            self.events.append({
+                'name': name, 'cat': group, 'ph': 'e', 'id': span_id, 'ts': self.now(),
+                'pid': self.pid, 'tid': self._tid(), 'args': {'completed_by': self._tid()}
+            })
+
+    def write(self, path: Path) -> None:
+        """
+        Write the trace as JSON.
+        :param path: Output path
+        :return: Void
+        """
+
+        with self.lock:
+            names = [
+                {'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': tid, 'args': {'name': name}}
+                for tid, name in self.threads.items()
+            ]
+            events = names + self.events
+
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps({'traceEvents': events, 'displayTimeUnit': 'ms'}))
+        print(f"Trace saved to '{path}'. Open it in https://ui.perfetto.dev or chrome://tracing")
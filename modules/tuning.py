@@ -0,0 +1,132 @@
+import os
+import platform
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable
+
+import vapoursynth as vs
+
+from .cache import default_cache_dir
+from .manifest import Manifest
+from .memory import DEFAULT_CACHE_MB
+
+core = vs.core
+
+# Tuned settings for each host, shared by every run on it
+PROFILE_NAME = 'tuning.json'
+# Number of frames rendered for each setting tried by the auto-tuner
+SAMPLE_FRAMES = 4
+
+
+def host_name() -> str:
+    """
+    Identify this host for tuning profiles. Includes the CPU count, so a resized VM is tuned again.
+    :return: Host key
+    """
+
+    return f"{platform.node()}-{platform.machine()}-{os.cpu_count()}cpu"
+
+
+def load_profile(path: Path = None) -> dict:
+    """
+    Load the tuned settings for this host.
+    :param path: Profile file. Default is in the user cache directory
+    :return: Settings ('threads', 'cache_size', 'writers'), or an empty dict if the host isn't tuned
+    """
+
+    return Manifest(path or default_cache_dir() / PROFILE_NAME).read().get(host_name(), {})
+
+
+def save_profile(settings: dict, path: Path = None) -> None:
+    """
+    Save tuned settings for this host.
+    :param settings: Settings to save
+    :param path: Profile file. Default is in the user cache directory
+    :return: Void
+    """
+
+    def save(data):
+        data[host_name()] = {**settings, 'tuned': datetime.now(timezone.utc).isoformat()}
+
+    Manifest(path or default_cache_dir() / PROFILE_NAME).update(save)
+
+
+def apply_settings(threads: int = None, cache_size: int = None) -> None:
+    """
+    Configure the VapourSynth core. Settings that aren't passed are left at their defaults.
+    :param threads: Number of VapourSynth threads
+    :param cache_size: Maximum frame cache size in MB
+    :return: Void
+    """
+
+    if threads:
+        core.num_threads = threads
+    if cache_size:
+        core.max_cache_size = cache_size
+
+
+def candidate_settings(threads: int = None, cache_size: int = None, writers: int = None) -> dict[str, list[int]]:
+    """
+    Values tried by the auto-tuner for each setting. Values passed on the command line are kept fixed.
+    :param threads: Fixed number of VapourSynth threads
+    :param cache_size: Fixed frame cache size in MB
+    :param writers: Fixed number of encoder threads
+    :return: Values of 'threads', 'cache_size' and 'writers', in the order they are tuned
+    """
+
+    cpus = os.cpu_count() or 1
+    # Half, the same as and twice the default cache size
+    base = DEFAULT_CACHE_MB
+
+    return {
+        'threads': [threads] if threads else sorted({max(1, cpus // 2), cpus}),
+        'cache_size': [cache_size] if cache_size else sorted({max(256, base // 2), base, base * 2}),
+        'writers': [writers] if writers else sorted({max(1, cpus // 4), max(1, cpus // 2), cpus})
+    }
+
+
+def autotune(render_sample: Callable[[dict], None], candidates: dict[str, list[int]]) -> dict:
+    """
+    Time a sample of the job under different settings and save the fastest for this host.
+
+    Settings are tuned one at a time: each value of a setting is tried with the best values found
+    so far for the others, starting from the middle value of each. Each sample builds its own
+    graph, so frames cached by one run don't speed up the next. A warm-up run reads the sample into
+    the OS file cache first, so the first candidate isn't penalized for cold reads.
+
+    :param render_sample: Function that renders the sample quietly with the given settings
+    :param candidates: Values to try for each setting, from `candidate_settings`
+    :return: Fastest settings
+    """
+
+    defaults = {'threads': core.num_threads, 'cache_size': core.max_cache_size}
+    best = {name: values[len(values) // 2] for name, values in candidates.items()}
+    timings = {}
+
+    def measure(settings):
+        key = tuple(settings.values())
+        if key not in timings:
+            apply_settings(settings['threads'], settings['cache_size'])
+            start = time.perf_counter()
+            render_sample(settings)
+            timings[key] = time.perf_counter() - start
+            print(f"  threads={settings['threads']:<4} cache={settings['cache_size']:<6} "
+                  f"writers={settings['writers']:<4} {timings[key]:.2f}s")
+        return timings[key]
+
+    runs = 1 + sum(len(values) - 1 for values in candidates.values())
+    print(f"Auto-tuning {runs} settings on '{host_name()}'...")
+    render_sample(best)
+    try:
+        for name, values in candidates.items():
+            best = min(({**best, name: value} for value in values), key=measure)
+    finally:
+        apply_settings(**defaults)
+
+    seconds = timings[tuple(best.values())]
+    save_profile({**best, 'seconds': round(seconds, 3)})
+    print(f"Fastest: threads={best['threads']}, cache={best['cache_size']} MB, writers={best['writers']}. "
+          f"Saved for later runs on this host\n")
+
+    return best
@@ -1,9 +1,17 @@
 import vapoursynth as vs
-import awsmfunc as awf
 import math
+import time
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from typing import Literal
 
+from .cache import IndexCache
+from .probe import ProbeCache
+from .report import RunReport, stage
+from .trace import Trace, span
+from .graph_profile import GraphProfiler
+
 core = vs.core
 
 # Type hints
@@ -12,20 +20,27 @@ RESIZE = Literal['720p', '1080p', '1440p', '2160p']
 KERNELS = Literal['bilinear', 'bicubic', 'point', 'lanczos', 'spline16', 'spline36', 'spline64']
 # Constants
 SUFFIXES = ['.mp4', '.mkv', '.m2ts', '.ts']
+INDEX_SUFFIXES = {
+    'ffms2': '.ffindex',
+    'lsmas': '.lwi'
+}
 DIMENSIONS = {
     '720p': [1280, 720],
     '1080p': [1920, 1080],
     '1440p': [2560, 1440],
     '2160p': [3840, 2160]
 }
+# Default style used by awsmfunc's FrameInfo
+FRAME_INFO_STYLE = "sans-serif,20,&H00FFFFFF,&H000000FF,&H00000000,&H00000000,0,0,0,0,100,100,0,0,1,2,0,7,10,10,10,1"
+# Resizers are looked up when used, since accessing `core.resize` initializes the core and loads every plugin
 KERNEL_DICT = {
-    'bilinear': core.resize.Bilinear,
-    'bicubic': core.resize.Bicubic,
-    'point': core.resize.Point,
-    'lanczos': core.resize.Lanczos,
-    'spline16': core.resize.Spline16,
-    'spline36': core.resize.Spline36,
-    'spline64': core.resize.Spline64
+    'bilinear': 'Bilinear',
+    'bicubic': 'Bicubic',
+    'point': 'Point',
+    'lanczos': 'Lanczos',
+    'spline16': 'Spline16',
+    'spline36': 'Spline36',
+    'spline64': 'Spline64'
 }
 
 
@@ -36,8 +51,27 @@ def path_exists(path):
         raise FileNotFoundError(f"The path: <{path}> does not exist")
 
 
+def index_path(file: Path, load_filter: LOAD = 'ffms2', cache: IndexCache = None) -> Path:
+    """
+    Get the path of the index file written for a media file.
+    :param file: Path to the media file
+    :param load_filter: Filter used to load & index the file
+    :param cache: Central index cache. If not passed, the index is written next to the media file
+    :return: Path to the index file
+    """
+
+    if load_filter not in INDEX_SUFFIXES:
+        raise ValueError("Unknown load filter specified. Options are 'ffms2' and 'lsmas'")
+
+    if cache:
+        return cache.path(file, INDEX_SUFFIXES[load_filter])
+
+    return Path(file).with_suffix(INDEX_SUFFIXES[load_filter])
+
+
 def verify_resize(clips: list[vs.VideoNode],
                   kernel: KERNELS = 'spline36',
+                  quiet: bool = False,
                   **kwargs) -> vs.VideoNode:
 
     """
@@ -48,6 +82,7 @@ def verify_resize(clips: list[vs.VideoNode],
     passed, this function will return suboptimal results.
     :param clips: Clips to process. Clip 0 should always be the source, followed by any encodes
     :param kernel: Resizing kernel to use
+    :param quiet: Don't print the detected resize
     :param kwargs: Additional keyword arguments to pass to the kernel resizer
     :return: A resized source if upscale/downscale is detected. Else, the source is returned untouched
     """
@@ -61,7 +96,7 @@ def verify_resize(clips: list[vs.VideoNode],
     src_width, src_height = clips[0].width, clips[0].height
     enc_width, enc_height = clips[1].width, clips[1].height
 
-    kernel = KERNEL_DICT[kernel.lower()]
+    kernel = getattr(core.resize, KERNEL_DICT[kernel.lower()])
 
     # Downscale. Try to account for column cropping
     if src_width - enc_width > 600:
@@ -89,10 +124,11 @@ def verify_resize(clips: list[vs.VideoNode],
     else:
         return clips[0]
 
-    print(
-        f"{type_scale} detected.\nSource dimensions: {src_width}x{src_height}"
-        f"\nEncode dimensions: {enc_width}x{enc_height}\nResizing kernel: {kernel}"
-    )
+    if not quiet:
+        print(
+            f"{type_scale} detected.\nSource dimensions: {src_width}x{src_height}"
+            f"\nEncode dimensions: {enc_width}x{enc_height}\nResizing kernel: {kernel}"
+        )
 
     return kernel(clip=clips[0], width=resized_width, height=resized_height, **kwargs)
 
@@ -100,13 +136,15 @@ def verify_resize(clips: list[vs.VideoNode],
 def crop_file(clip: vs.VideoNode,
               width: int,
               height: int,
-              mod_crop: int = 2) -> vs.VideoNode:
+              mod_crop: int = 2,
+              quiet: bool = False) -> vs.VideoNode:
     """
     Function for cropping files before processing.
     :param clip: Clip to crop
     :param width: Crop width
     :param height: Crop height
     :param mod_crop: Crop video in accordance to the modulus value specified
+    :param quiet: Don't print the crop values
     :return: Cropped clip
     """
 
@@ -124,11 +162,12 @@ def crop_file(clip: vs.VideoNode,
         right += 1
         left += 1
 
-    print(f"Crop values:\nLeft: {left}\nRight: {right}\nTop: {top}\nBottom: {bottom}")
-    dim_width = src_width - (left + right)
-    dim_height = src_height - (top + bottom)
-    print(f"Input Dimensions: {src_width}x{src_height}")
-    print(f"Cropped Dimensions: {dim_width}x{dim_height}\n")
+    if not quiet:
+        print(f"Crop values:\nLeft: {left}\nRight: {right}\nTop: {top}\nBottom: {bottom}")
+        dim_width = src_width - (left + right)
+        dim_height = src_height - (top + bottom)
+        print(f"Input Dimensions: {src_width}x{src_height}")
+        print(f"Cropped Dimensions: {dim_width}x{dim_height}\n")
 
     return core.std.Crop(clip, left, right, top, bottom)
 
@@ -136,19 +175,32 @@ def crop_file(clip: vs.VideoNode,
 def load_clips(files: list = None,
                folder: Path = None,
                source_name: str = None,
-               load_filter: LOAD = 'ffms2') -> list[vs.VideoNode]:
+               load_filter: LOAD = 'ffms2',
+               workers: int = None,
+               index_cache: IndexCache = None,
+               probe_cache: ProbeCache = None,
+               trace: Trace = None,
+               quiet: bool = False) -> list[vs.VideoNode]:
 
     """
     Load clips for processing.
 
     This function converts file paths to VapourSynth clips. Clips can be loaded using either
     ffms2 or lsmas as set by the `load_filter` argument. Default is ffms2 because it is needed
-    for use with dynamic tonemapping.
+    for use with dynamic tonemapping. Files are indexed concurrently, and clips are returned in the
+    same order as the files. When an index cache is passed, indexes are stored there instead of
+    next to the media. When a probe cache is passed, each file's metadata is probed (or read from
+    the cache) as soon as it is loaded, so later stages can read it without decoding a frame.
 
     :param files: List of filepaths to load as clips
     :param folder: A folder containing files to load as clips
     :param source_name: Source file's name. Used to distinguish source from encodes
     :param load_filter: Filter used to load clips. Default is ffm2
+    :param workers: Number of files indexed at once. Default indexes all files at once
+    :param index_cache: Central cache used to store indexes
+    :param probe_cache: Cache used to store clip metadata
+    :param trace: Trace used to record a span for each file loaded
+    :param quiet: Don't print progress
     :return: A list of loaded clips
     """
 
@@ -158,11 +210,9 @@ def load_clips(files: list = None,
         )
 
     if load_filter == 'ffms2':
-        load_filter = core.ffms2.Source
-        suffix = '.ffindex'
+        source = core.ffms2.Source
     elif load_filter == 'lsmas':
-        load_filter = core.lsmas.LWLibavSource
-        suffix = '.lwi'
+        source = core.lsmas.LWLibavSource
     else:
         raise ValueError("Unknown load filter specified. Options are 'ffms2' and 'lsmas'")
 
@@ -175,59 +225,179 @@ def load_clips(files: list = None,
         src = max([f for f in folder.iterdir()], key=lambda x: x.stat().st_size)
         files = [f for f in folder.iterdir() if f.suffix in SUFFIXES and f.stem != src.stem]
 
-    clips = [load_filter(f, cachefile=f.with_suffix(suffix)) for f in files]
+    def load(file):
+        start = time.perf_counter()
+        index = index_path(file, load_filter, index_cache)
+        with span(trace, 'index', file=file.name, filter=load_filter):
+            clip = source(file, cachefile=str(index))
+        if index_cache:
+            index_cache.commit(file, index)
+        if probe_cache:
+            with span(trace, 'probe', file=file.name):
+                probe_cache.get(clip, file, load_filter)
+        return clip, time.perf_counter() - start
+
+    clips = [None] * len(files)
+    with ThreadPoolExecutor(max_workers=workers or max(len(files), 1), thread_name_prefix='index') as executor:
+        futures = {executor.submit(load, f): i for i, f in enumerate(files)}
+        for done, future in enumerate(as_completed(futures), start=1):
+            i = futures[future]
+            clips[i], elapsed = future.result()
+            if not quiet:
+                print(f"Loaded {done}/{len(files)}: '{files[i].name}' in {elapsed:.2f}s")
+
+    if index_cache:
+        index_cache.evict()
 
     return clips
 
 
+def sparse_frames(frames: list[int]) -> list[int]:
+    """
+    Get the frames kept by `sparse_clip`, in the order they are spliced.
+    :param frames: Requested frames
+    :return: Sorted, unique frames
+    """
+
+    return sorted(set(frames))
+
+
+def sparse_clip(clip: vs.VideoNode, frames: list[int]) -> vs.VideoNode:
+    """
+    Splice together only the requested frames of a clip.
+
+    Filters applied to the returned clip only ever evaluate the requested frames, so their cost
+    scales with the number of screenshots instead of the clip length. The original frame number
+    and length are stored in the `SourceFrame` and `SourceFrames` frame properties.
+
+    :param clip: Clip to trim
+    :param frames: Frames to keep. Use `sparse_frames` to map frames to positions in the returned clip
+    :return: Clip containing only the requested frames
+    """
+
+    return core.std.Splice([
+        core.std.SetFrameProps(clip[n], SourceFrame=n, SourceFrames=clip.num_frames)
+        for n in sparse_frames(frames)
+    ])
+
+
+def frame_info(clip: vs.VideoNode, title: str, style: str = FRAME_INFO_STYLE, newlines: int = 3) -> vs.VideoNode:
+    """
+    Add a frame info overlay that reports original frame numbers.
+
+    Works like awsmfunc's FrameInfo, but reads the frame number and clip length from the
+    `SourceFrame` and `SourceFrames` properties set by `sparse_clip` when they are present.
+
+    :param clip: Clip to overlay
+    :param title: Title shown under the frame info
+    :param style: ASS style used for the overlay
+    :param newlines: Number of lines between the top of the frame and the title
+    :return: Clip with the overlay
+    """
+
+    def frame_props(n, f, clip):
+        frame = f.props.get('SourceFrame', n)
+        total = f.props.get('SourceFrames', clip.num_frames)
+        pict_type = f.props['_PictType'].decode() if '_PictType' in f.props else 'N/A'
+        return core.sub.Subtitle(clip, text=[f"Frame {frame} of {total}\nPicture type: {pict_type}"], style=style)
+
+    clip = core.std.FrameEval(clip, partial(frame_props, clip=clip), prop_src=clip)
+    return core.sub.Subtitle(clip, text=[" " + "\n" * newlines + title], style=style)
+
+
+def overlay_clips(clips: list[vs.VideoNode], clip_titles: list[str] = None) -> list[vs.VideoNode]:
+    """
+    Add frame info overlays to clips, titled with their clip titles.
+    :param clips: Clips to overlay
+    :param clip_titles: Titles for the overlays. Clips are titled by index if the lengths don't match
+    :return: Clips with overlays
+    """
+
+    if clip_titles and len(clip_titles) != len(clips):
+        print("WARNING: The number of titles does not match the number of clips\n")
+        clip_titles = None
+    if not clip_titles:
+        clip_titles = [f"Clip {i}" for i in range(len(clips))]
+
+    return [frame_info(c, t) for c, t in zip(clips, clip_titles)]
+
+
+def needs_tonemap(clip: vs.VideoNode, metadata: dict = None) -> bool:
+    """
+    Check if a clip needs tonemapping, i.e. it uses 2020ncl matrix coefficients.
+    :param clip: Source clip
+    :param metadata: Probed metadata for the clip. Avoids decoding a frame when passed
+    :return: True if the clip should be tonemapped
+    """
+
+    if metadata:
+        return metadata['matrix'] == 9
+
+    return clip.get_frame(0).props.get('_Matrix') == 9
+
+
 def prepare_clips(clips: list[vs.VideoNode],
                   crop_dimensions: list[int, int],
                   clip_titles: list[str] = None,
-                  add_frame_info: bool = True) -> list[vs.VideoNode]:
+                  add_frame_info: bool = True,
+                  frames: list[list[int]] = None,
+                  metadata: list[dict] = None,
+                  report: RunReport = None,
+                  trace: Trace = None,
+                  profiler: GraphProfiler = None,
+                  quiet: bool = False) -> list[vs.VideoNode]:
 
     """
     Helper function used to prepare clips for comparison or screenshots.
 
     Prepare clips for usage through the following steps:
 
+    - If frames were provided, trim clips down to only those frames
     - Crop files using provided dimensions
     - If input clips are HDR, tonemap them
-    - If titles were provided, zip them with their clips
-    - If frame info overlays are desired, add them
+    - If frame info overlays are desired, add them with the provided titles
 
     :param clips: Clips to process. The first clip should always be the source
     :param crop_dimensions: Dimensions used for cropping clips
     :param clip_titles: Titles for frame info overlays. The length of titles must match the length of clips
     :param add_frame_info: Boolean for adding frame info overlay. Default enabled
+    :param frames: Frames to keep for each clip. When passed, clips are built with `sparse_clip`
+    :param metadata: Probed metadata for each clip. Avoids decoding a frame to detect HDR
+    :param report: Run report used to time each step
+    :param trace: Trace used to record a span for each step
+    :param profiler: Profiler used to time each step per frame. Probes are added after every step
+    :param quiet: Don't print crop values and other progress
     :return: List of prepared clips
     """
 
+    def probe(clips, name):
+        return [profiler.probe(c, i, name) for i, c in enumerate(clips)] if profiler else clips
+
+    # Only process requested frames
+    if frames:
+        with stage(report, 'graph_sparse'), span(trace, 'graph_sparse'):
+            clips = [sparse_clip(c, f) for c, f in zip(clips, frames)]
+        if profiler:
+            for i, f in enumerate(frames):
+                profiler.set_frames(i, sparse_frames(f))
+
     # Crop clips
-    clips = [crop_file(c, width=crop_dimensions[0], height=crop_dimensions[1]) for c in clips]
+    with stage(report, 'graph_crop'), span(trace, 'graph_crop'):
+        clips = [crop_file(c, width=crop_dimensions[0], height=crop_dimensions[1], quiet=quiet) for c in clips]
+    clips = probe(clips, 'crop')
 
     # Tonemap if source uses 2020ncl matrix coefficients
-    if clips[0].get_frame(0).props["_Matrix"] == 9:
-        clips = [awf.DynamicTonemap(clip=c) for c in clips]
-
-    # Zip together clips and titles if present
-    if clip_titles:
-        if len(clip_titles) != len(clips):
-            print("WARNING: The number of titles does not match the number of clips\n")
-            zipped = False
-        else:
-            clips = zip(clips, clip_titles)
-            zipped = True
-    else:
-        zipped = False
+    with stage(report, 'graph_tonemap'), span(trace, 'graph_tonemap'):
+        if needs_tonemap(clips[0], metadata[0] if metadata else None):
+            import awsmfunc as awf
+            clips = probe([awf.DynamicTonemap(clip=c) for c in clips], 'tonemap')
 
     # Add frame info overlay unless specified otherwise
-    if add_frame_info and zipped:
-        clips = list(clips)
-        clips = [awf.FrameInfo(c[0], c[1]) for c in clips]
-    elif add_frame_info:
-        clips = [awf.FrameInfo(c, f"Clip {i}") for i, c in enumerate(clips)]
-    else:
-        print("Frame overlay disabled")
+    with stage(report, 'graph_overlay'), span(trace, 'graph_overlay'):
+        if add_frame_info:
+            clips = probe(overlay_clips(clips, clip_titles), 'overlay')
+        elif not quiet:
+            print("Frame overlay disabled")
 
     return clips
 
@@ -259,6 +429,7 @@ def get_dimensions(resolution: str | int, clip: vs.VideoNode = None) -> list[int
         raise ValueError(f"Unknown resolution: {resolution}")
 
     if clip:
+        import awsmfunc as awf
         resized = awf.zresize(clip, preset=num)
         dimensions = [resized.width, resized.height]
 
@@ -6,6 +6,7 @@ It is a pythonic solution to play or compare vapoursynth clips by using opencv m
 import os
 import sys
 import platform
+import re
 import timeit
 
 import vapoursynth as vs
@@ -13,13 +14,9 @@ from vapoursynth import core
 import numpy as np
 import cv2
 
-try:
-    from distutils.version import StrictVersion
-
-    if StrictVersion(cv2.__version__) < StrictVersion('3.4.1'):
-        raise Exception('\n' + f'openCV version is {cv2.__version__}, it needs to be at least 3.4.1')
-except ImportError:
-    pass
+# distutils is slow to import and was removed in Python 3.12, so compare the version numbers directly
+if tuple(int(v) for v in re.findall(r'\d+', cv2.__version__)[:3]) < (3, 4, 1):
+    raise Exception('\n' + f'openCV version is {cv2.__version__}, it needs to be at least 3.4.1')
 
 # optional for windows or linux but needed for darwin platform to figure out free RAM
 try:
@@ -269,7 +266,8 @@ class Preview:
                  frames=None, delay=None, img_dir=None, matrix_in_s=None, kernel='Point',
                  mod_x=2, mod_y=2, ignore_subsampling=False,
                  position=(60, 60), preview_width=None, preview_height=None,
-                 output_window=False, fullscreen=False, play=False, slider=False):
+                 output_window=False, fullscreen=False, play=False, slider=False, metadata=None, trace=None,
+                 profiler=None):
 
         # setting output print first
         self.validate_boolean(dict(output_window=output_window))
@@ -310,6 +308,9 @@ class Preview:
         self.play = play
         self.slider = slider
         self.ignore_subsampling = ignore_subsampling
+        self.metadata = metadata  # probed metadata per clip, saves decoding frame 0 to read _Matrix
+        self.trace = trace  # modules.trace.Trace, records a span for each frame shown
+        self.profiler = profiler  # modules.graph_profile.GraphProfiler, times the RGB conversion of each frame
         try:
             self.validate_clips()
         except ValueError as err:
@@ -356,8 +357,13 @@ class Preview:
             self.rgbs_error.append(True)
 
         for i, clip in enumerate(self.clips_orig):
-            rgb, log = convert.toRGB(clip, matrix_in_s=self.matrix_in_s, depth=depth, kernel=self.kernel,
+            matrix_in_s = self.matrix_in_s
+            if not matrix_in_s and self.metadata and i < len(self.metadata):
+                matrix_in_s = Conversions.MATRIX_USABLE.get(self.metadata[i]['matrix'])
+            rgb, log = convert.toRGB(clip, matrix_in_s=matrix_in_s, depth=depth, kernel=self.kernel,
                                      sample_type=sample_type)
+            if self.profiler and isinstance(rgb, vs.VideoNode):
+                rgb = self.profiler.request(self.profiler.probe(rgb, i, 'to_rgb'), i)
             log = 'clip {} to RGB for preview:\n'.format(i + 1) + log
 
             try:
@@ -509,14 +515,19 @@ class Preview:
         delay is handled here, not in cv2.waitKey() because timeit.default_timer() takes app&system  time overhead into an account
         '''
 
+        if self.trace: start = self.trace.now()
         try:
             f = self.rgbs[self.i].get_frame(self.frame)
         except:
             f = self.error_frame()
+        if self.trace:
+            self.trace.add_span('get_frame', start, self.trace.now(), clip=self.i, frame=self.frame)
+            start = self.trace.now()
         if isAPI4:
             self.img = np.dstack([np.array(f[p], copy=False) for p in [2, 1, 0]])
         else:
             self.img = np.dstack([np.array(f.get_read_array(p), copy=False) for p in [2, 1, 0]])
+        if self.trace: self.trace.add_span('frame_to_array', start, self.trace.now(), clip=self.i, frame=self.frame)
         if self.isCropping and self.x1 is not None:
             img = self.img_and_selection(self.img, (self.x1, self.y1, self.x2, self.y2), self.color)
             if self.play: self.delay_it()
@@ -12,10 +12,11 @@ You can pass the script a series of specific frames, or generate random frames u
 argument to specify a frame offset from the source so screenshots are properly aligned. If the source
 is HDR/DoVi/HDR10+, the screenshots are automatically tonemapped.
 
-Each screenshot is tagged with an alphabet character to distinguish which video it corresponds to;
-for example, source screens will be '1a.png', '2a.png', encode 1 screens will be '1b.png', '2b.png',
-etc. When existing screenshots are detected, the alphabet characters are incremented to prevent
-overwriting if the new ones are saved to an existing directory.
+Each screenshot is tagged with letters to distinguish which video it corresponds to; for example,
+source screens will be '01a.png', '02a.png', encode 1 screens will be '01b.png', '02b.png', etc.
+Tags are recorded in a `screenshots.json` manifest in the output directory, so new screenshots saved
+to an existing directory get the next free tag ('z' is followed by 'aa', 'ab', ...) instead of
+overwriting.
 
 --- EXAMPLES ---
 
@@ -36,20 +37,61 @@ Use `--help` for the full list of options.
 """
 
 import vapoursynth as vs
-import awsmfunc as awf
 
 import argparse
-import re
+import math
+import multiprocessing
+import os
+import queue
 import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, replace
+from functools import partial
 from pathlib import Path
+from typing import Callable, NamedTuple
 
 from modules import (
     path_exists,
     verify_resize,
     load_clips,
     prepare_clips,
+    index_path,
+    sparse_frames,
+    needs_tonemap,
+    overlay_clips,
+    IndexCache,
+    ProbeCache,
+    default_cache_dir,
+    fingerprint,
+    DEFAULT_CACHE_SIZE,
     SUFFIXES
 )
+from modules.render import (
+    render_frames,
+    screenshot_requests,
+    to_rgb,
+    roi_crop,
+    thumbnail,
+    encode_params,
+    IMAGE_FORMATS,
+    VARIANTS
+)
+from modules.grid import GridBuilder, GRIDS
+from modules.manifest import allocate_tags, next_run, record_duplicates
+from modules.dedup import ImageStore
+from modules.memory import cache_limit, plan_memory
+from modules.output import ImageWriter
+from modules.render_cache import RenderCache
+from modules.sink import open_sink, SINKS
+from modules.pool import ClipPool
+from modules.report import RunReport, stage
+from modules.trace import Trace, span
+from modules.tuning import apply_settings, autotune, candidate_settings, load_profile, SAMPLE_FRAMES
+from modules.graph_profile import GraphProfiler
+from modules.schedule import read_keyframes, schedule_requests, DEFAULT_GOP_SIZE
 
 try:
     import argcomplete
@@ -61,7 +103,60 @@ except ImportError:
 core = vs.core
 
 
-def parse_args():
+@dataclass
+class Options:
+    """
+    Options for one screenshot run, as returned by `parse_args`. Change them with `dataclasses.replace`.
+    """
+
+    # Input
+    files: list[Path] = ()
+    crop: list[int] = None
+    titles: list[str] = None
+    kernel: str = 'spline36'
+    overlay: bool = True
+    frames: list[int] = None
+    rand_frames: list[int] = None
+    seed: int = None
+    offset: int = 0
+    no_source: bool = False
+    load_filter: str = 'ffms2'
+    index_workers: int = None
+    index_cache: IndexCache = None
+    sparse: bool = False
+    # Output
+    out_folder: Path = None
+    image_format: str = 'png'
+    compression: int = 9
+    quality: int = 95
+    variants: list[str] = None
+    rois: list[tuple[str, int, int, int, int]] = ()
+    roi_scales: list[int] = (2,)
+    thumb_width: int = 480
+    grids: list[str] = None
+    tile_width: int = 480
+    grid_columns: int = None
+    sink: str = 'dir'
+    store: ImageStore = None
+    render_cache: RenderCache = None
+    # Performance. The memory budget is in bytes
+    in_flight: int = None
+    writers: int = None
+    gop_size: int = DEFAULT_GOP_SIZE
+    processes: int = 1
+    encode_processes: int = None
+    memory_budget: int = None
+    threads: int = None
+    cache_size: int = None
+    autotune: bool = False
+    # Diagnostics. Quiet runs don't print progress, e.g. the auto-tuner's samples
+    quiet: bool = False
+    report_path: Path = None
+    trace_path: Path = None
+    profile_filters: bool = False
+
+
+def parse_args(argv: list[str] = None) -> Options:
     parser = argparse.ArgumentParser(
         description=(
             'CLI script for generating comparison screenshots using VapourSynth. '
@@ -80,6 +175,8 @@ def parse_args():
                         help="Screenshot frames. If running tests, be sure to set '--offset'")
     parser.add_argument('--random_frames', '-r', nargs=3, metavar=('START', 'STOP', 'COUNT'), type=int,
                         help="Generate random frames in the form 'start stop count'. If running tests, be sure to set '--offset'")
+    parser.add_argument('--seed', metavar='SEED', type=int, nargs='?',
+                        help="Seed used to generate random frames, so a run can be reproduced")
     parser.add_argument('--offset', '-o', nargs='?', metavar='OFFSET', type=int, default=0,
                         help="Offset (in frames) from source. Useful for comparing test encodes")
     parser.add_argument('--crop', '-c', nargs='+', metavar='CROP', type=int,
@@ -96,10 +193,99 @@ def parse_args():
                         help="Specify kernel used for resizing (if encodes are upscaled/downscaled). Default is 'spline36'")
     parser.add_argument('--load_filter', '-lf', type=str, choices=('lsmas', 'ffms2'), default='ffms2',
                         help="Filter used to load & index clips. Default is 'ffms2'")
+    parser.add_argument('--index_workers', '-iw', metavar='WORKERS', type=int, nargs='?',
+                        help="Number of files indexed at once. Default indexes all files at once")
+    parser.add_argument('--index_cache', '-ic', metavar='CACHE_DIR', type=Path, nargs='?',
+                        default=default_cache_dir() / 'index',
+                        help="Directory where source indexes are cached. Default is the user cache directory")
+    parser.add_argument('--index_cache_size', '-is', metavar='GB', type=float, nargs='?',
+                        default=DEFAULT_CACHE_SIZE / 1024 ** 3,
+                        help=f"Maximum size of the index cache in GB. Default is {DEFAULT_CACHE_SIZE // 1024 ** 3}")
     parser.add_argument('--no_frame_info', '-ni', action='store_false',
                         help="Don't add frame info overlay to clips. This flag negates the default behavior")
+    parser.add_argument('--sparse', '-sp', action='store_true',
+                        help="Only run cropping, tonemapping and overlays on the requested frames instead of the full clips")
+    parser.add_argument('--in_flight', '-if', metavar='FRAMES', type=int, nargs='?',
+                        help="Maximum number of frames rendered at once across all clips. Default is the VapourSynth thread count")
+    parser.add_argument('--gop_size', '-g', metavar='FRAMES', type=int, nargs='?', default=DEFAULT_GOP_SIZE,
+                        help="Frames closer than this are decoded in one pass when keyframes can't be read from the index. "
+                             f"Default is {DEFAULT_GOP_SIZE}")
+    parser.add_argument('--report', metavar='REPORT', type=Path, nargs='?',
+                        help="Save per-stage and per-frame timings for the run to a JSON file. 'graph_*' stages only "
+                             "time building the filter graph. Add --profile_filters for per-filter render times")
+    parser.add_argument('--profile_filters', '-pf', action='store_true',
+                        help="Time each stage of the filter graph (decode, resize, crop, tonemap, overlay, RGB "
+                             "conversion) per frame and print mean, p95 and max milliseconds per clip")
+    parser.add_argument('--trace', metavar='TRACE', type=Path, nargs='?',
+                        help="Save a timeline of frame requests, filter graph setup and image writes in Chrome "
+                             "trace-event format. With '--profile_filters', each frame's time in every filter stage "
+                             "is added too. Open it in Perfetto or chrome://tracing")
+    parser.add_argument('--variants', '-vr', metavar='VARIANTS', type=str, nargs='+', choices=VARIANTS,
+                        help="Images saved from each rendered frame: 'overlay', 'clean', 'roi' (zoomed crops set "
+                             "with --roi) and 'thumb'. Frames are only decoded once. Default is 'overlay', or 'clean' "
+                             "with --no_frame_info")
+    parser.add_argument('--roi', metavar=('NAME', 'X', 'Y', 'WIDTH', 'HEIGHT'), type=str, nargs=5, action='append',
+                        help="Named region cropped for the 'roi' variant, in cropped frame coordinates. Can be repeated")
+    parser.add_argument('--roi_scale', '-rs', metavar='SCALE', type=int, nargs='+', default=[2],
+                        help="Nearest-neighbour zoom factors applied to each ROI crop. Default is 2")
+    parser.add_argument('--thumb_width', '-tw', metavar='WIDTH', type=int, nargs='?', default=480,
+                        help="Width of images saved for the 'thumb' variant. Default is 480")
+    parser.add_argument('--grids', '-gr', metavar='GRIDS', type=str, nargs='+', choices=GRIDS,
+                        help="Build 'contact' sheets (every frame of a clip) and/or 'compare' grids (one frame across "
+                             "every clip) from the rendered frames. Saved to a 'grids' subfolder")
+    parser.add_argument('--tile_width', '-tl', metavar='WIDTH', type=int, nargs='?', default=480,
+                        help="Width of each grid tile. Default is 480")
+    parser.add_argument('--grid_columns', '-gc', metavar='COLUMNS', type=int, nargs='?',
+                        help="Number of columns in each grid. Default makes grids roughly square")
+    parser.add_argument('--sink', '-sk', type=str, choices=SINKS, default='dir',
+                        help="Write images as files ('dir'), or stream them into a 'tar' or 'zip' archive in the output "
+                             "directory with a JSON index of each image's clip, tag and frame. Default is 'dir'")
+    parser.add_argument('--render_cache', '-rc', metavar='CACHE_DIR', type=Path, nargs='?',
+                        const=default_cache_dir() / 'render',
+                        help="Cache rendered frames so later runs with the same files, frames and settings skip "
+                             "decoding. Pass a directory, or no value to use the user cache directory")
+    parser.add_argument('--render_cache_size', '-rz', metavar='GB', type=float, nargs='?',
+                        default=DEFAULT_CACHE_SIZE / 1024 ** 3,
+                        help=f"Maximum size of the render cache in GB. Default is {DEFAULT_CACHE_SIZE // 1024 ** 3}")
+    parser.add_argument('--dedup', '-dd', action='store_true',
+                        help="Hash each rendered frame before encoding and link images that were already saved by an "
+                             "earlier run from the image store instead of encoding them again")
+    parser.add_argument('--image_store', '-st', metavar='STORE_DIR', type=Path, nargs='?',
+                        default=default_cache_dir() / 'images',
+                        help="Directory where encoded images are stored for '--dedup'. Images are hardlinked when it "
+                             "is on the same drive as the output. Default is the user cache directory")
+    parser.add_argument('--image_store_size', '-ss', metavar='GB', type=float, nargs='?',
+                        default=DEFAULT_CACHE_SIZE / 1024 ** 3,
+                        help=f"Maximum size of the image store in GB. Default is {DEFAULT_CACHE_SIZE // 1024 ** 3}")
+    parser.add_argument('--format', '-fmt', type=str, choices=tuple(IMAGE_FORMATS), default='png',
+                        help="Output image format. 'webp' is lossless and 'ppm' is uncompressed. Default is 'png'")
+    parser.add_argument('--compression', '-cl', metavar='LEVEL', type=int, nargs='?', default=9,
+                        choices=range(10),
+                        help="PNG zlib compression level, from 0 (fastest) to 9 (smallest). Default is 9")
+    parser.add_argument('--quality', '-q', metavar='QUALITY', type=int, nargs='?', default=95,
+                        help="JPEG quality, from 0 to 100. Default is 95")
+    parser.add_argument('--writers', '--encoder_threads', '-w', metavar='THREADS', type=int, nargs='?',
+                        help="Number of threads used to encode and write images. Default is half the CPU count, or "
+                             "the tuned value for this host")
+    parser.add_argument('--threads', '-th', metavar='THREADS', type=int, nargs='?',
+                        help="Number of VapourSynth threads. Default is the CPU count, or the tuned value for this host")
+    parser.add_argument('--cache_size', '-cs', metavar='MB', type=int, nargs='?',
+                        help="Maximum size of the VapourSynth frame cache in MB. Default is the VapourSynth default, "
+                             "or the tuned value for this host")
+    parser.add_argument('--autotune', '-at', action='store_true',
+                        help="Render a short sample of the job with a few thread and cache settings, and use the "
+                             "fastest for this run. The result is saved and used by later runs on this host")
+    parser.add_argument('--encode_processes', '-ep', metavar='PROCESSES', type=int, nargs='?',
+                        help="Encode images in this many processes instead of threads. Frames are passed to them "
+                             "through shared memory. Default encodes in '--writers' threads")
+    parser.add_argument('--memory_budget', '-mb', metavar='GB', type=float, nargs='?',
+                        help="Memory budget in GB. Frames in flight, queued images and the VapourSynth cache are "
+                             "limited to fit, and clips are rendered in groups if needed. Default is unlimited")
+    parser.add_argument('--processes', '-pr', metavar='PROCESSES', type=int, nargs='?', default=1,
+                        help="Split the frames across this many worker processes, each with its own VapourSynth core. "
+                             "Default is 1")
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     print("------------------------ START ------------------------")
 
     # Check input
@@ -110,6 +296,14 @@ def parse_args():
         )
     if not args.encodes and not args.input_directory and not args.source:
         raise NameError("No files or directories were provided")
+    if not 0 <= args.quality <= 100:
+        raise ValueError("JPEG quality must be between 0 and 100")
+    if args.variants and 'roi' in args.variants and not args.roi:
+        raise NameError("The 'roi' variant requires at least one region set with `--roi NAME X Y WIDTH HEIGHT`")
+    try:
+        rois = [(name, *map(int, rect)) for name, *rect in args.roi or []]
+    except ValueError:
+        raise ValueError("ROI coordinates must be integers in the form 'NAME X Y WIDTH HEIGHT'")
 
     # Set root for folder iteration
     if not args.source:
@@ -142,9 +336,8 @@ def parse_args():
             print(f"Failed to generate output folder: {e}. Using '{root}' instead")
             args.output_directory = root / f'screens-offset_{args.offset}'
     elif not args.output_directory:
-        # don't overwrite
-        screen_count = sum(1 for d in root.iterdir() if d.is_dir() and 'screens' in d.stem)
-        args.output_directory = root / f'screens t{screen_count + 1}-offset_{args.offset}'
+        # don't overwrite. Runs are counted in a sidecar in root instead of scanning for folders
+        args.output_directory = root / f'screens t{next_run(root)}-offset_{args.offset}'
         args.output_directory.mkdir(parents=True, exist_ok=True)
 
     # Only encodes passed
@@ -166,69 +359,300 @@ def parse_args():
     elif not args.titles:
         args.titles = [str(f.stem) for f in files]
 
-    return (files,
-            args.crop,
-            args.titles,
-            args.output_directory,
-            args.resize_kernel,
-            args.no_frame_info,
-            args.frames,
-            args.random_frames,
-            args.offset,
-            args.load_filter[0] if type(args.load_filter) is list else args.load_filter,
-            no_src)
+    return Options(
+        files=files,
+        crop=args.crop,
+        titles=args.titles,
+        kernel=args.resize_kernel,
+        overlay=args.no_frame_info,
+        frames=args.frames,
+        rand_frames=args.random_frames,
+        seed=args.seed,
+        offset=args.offset,
+        no_source=no_src,
+        load_filter=args.load_filter[0] if type(args.load_filter) is list else args.load_filter,
+        index_workers=args.index_workers,
+        index_cache=IndexCache(args.index_cache, int(args.index_cache_size * 1024 ** 3)),
+        sparse=args.sparse,
+        out_folder=args.output_directory,
+        image_format=args.format,
+        compression=args.compression,
+        quality=args.quality,
+        variants=args.variants,
+        rois=rois,
+        roi_scales=args.roi_scale,
+        thumb_width=args.thumb_width,
+        grids=args.grids,
+        tile_width=args.tile_width,
+        grid_columns=args.grid_columns,
+        sink=args.sink,
+        store=ImageStore(args.image_store, int(args.image_store_size * 1024 ** 3)) if args.dedup else None,
+        render_cache=RenderCache(args.render_cache, int(args.render_cache_size * 1024 ** 3)) if args.render_cache else None,
+        in_flight=args.in_flight,
+        writers=args.writers,
+        gop_size=args.gop_size,
+        processes=max(1, args.processes),
+        encode_processes=args.encode_processes,
+        memory_budget=int(args.memory_budget * 1024 ** 3) if args.memory_budget else None,
+        threads=args.threads,
+        cache_size=args.cache_size,
+        autotune=args.autotune,
+        report_path=args.report,
+        trace_path=args.trace,
+        profile_filters=args.profile_filters
+    )
+
+
+def clip_frames(frames: list[int], offset: int, clip_count: int, no_source: bool = False) -> list[list[int]]:
+    """
+    Get the frames to screenshot for each clip.
+    :param frames: Screenshot frames
+    :param offset: Frame offset from source. Applied to the source frames only
+    :param clip_count: Number of clips
+    :param no_source: Boolean indicating if source was passed
+    :return: List of frames for each clip, in the same order as the clips
+    """
+
+    if no_source:
+        return [frames for _ in range(clip_count)]
+
+    src_frames = [x + offset for x in frames] if offset else frames
+    return [src_frames, *[frames for _ in range(clip_count - 1)]]
 
 
 def generate_screenshots(clips: list[vs.VideoNode],
                          folder: Path,
                          frames: list,
-                         offset: int = None,
-                         no_source: bool = False) -> None:
+                         options: Options = None,
+                         keyframes: list[list[int] | None] = None,
+                         matrices: list[int] = None,
+                         overlays: list[vs.VideoNode] = None,
+                         variants: list[str] = None,
+                         tags: list[str] = None,
+                         skip: set[tuple[int, int]] = None,
+                         on_saved: Callable[[int, int, list[dict]], None] = None,
+                         cache_keys: list[str] = None,
+                         shard: int = None,
+                         report: RunReport = None,
+                         trace: Trace = None,
+                         profiler: GraphProfiler = None) -> None:
 
     """
-    Generate screenshots using ScreenGen.
+    Generate screenshots for all clips.
+
+    Frames are requested concurrently across every clip in GOP order, and each rendered frame is
+    handed to a pool of encoders that save its variants. Grids, caches, sinks and the memory budget
+    are set in `options`.
+
     :param clips: Source and encode clips to process
     :param folder: Output folder for screenshots
     :param frames: Screenshot frames
-    :param offset: Frame offset from source. Used for generating test encodes
-    :param no_source: Boolean indicating if source was passed
+    :param options: Options returned by `parse_args`. Sets the frame offset, concurrency, output format, ROIs,
+        grids, sink, caches and memory budget. Default is `Options()`
+    :param keyframes: Keyframe numbers for each clip, read from the source index. Used to group frames by GOP
+    :param matrices: Matrix coefficients of each clip. If not passed, frame 0 of each clip is decoded to read them
+    :param overlays: Clips with frame info overlays, rendered alongside `clips`. Pass when `clips` are clean
+    :param variants: Images saved from each frame. One of VARIANTS. Default saves `clips` as they are
+    :param tags: Tag for each clip. If not passed, tags are allocated so existing screenshots aren't overwritten
+    :param skip: (clip index, frame) pairs that were already saved and should not be rendered again
+    :param on_saved: Function called with the clip index, frame and saved images once every image of a frame is
+        written. Each image has its variant and its 'path', or its 'archive' and 'entry' name
+    :param cache_keys: Render cache key of each clip, from `RenderCache.key`. Required with a render cache
+    :param shard: Worker number when the run is split across processes. Keeps archive names unique
+    :param report: Run report used to record render and write timings
+    :param trace: Trace used to record frame requests, conversions and image writes
+    :param profiler: Profiler used to time the RGB conversion and frame requests of each clip
     :return: Void
     """
 
-    chars = []
+    options = options or Options()
+    in_flight, writers = options.in_flight, options.writers
+    store, render_cache = options.store, options.render_cache
     clip_len = len(clips)
+    variants = variants or ['clean']
+    if 'roi' in variants:
+        for name, x, y, width, height in options.rois or []:
+            if x < 0 or y < 0 or x + width > clips[0].width or y + height > clips[0].height:
+                raise ValueError(f"ROI '{name}' is outside the {clips[0].width}x{clips[0].height} frame")
+    frame_lists = clip_frames(frames, options.offset, clip_len, options.no_source)
+    if not tags:
+        tags = allocate_tags(folder, [None] * clip_len, frame_lists)
+    if report:
+        report.set_tags(tags)
+    requests = screenshot_requests(frame_lists, tags)
+    if skip:
+        requests = [r for r in requests if (r.clip, r.frame) not in skip]
+    requests = schedule_requests(requests, keyframes, options.gop_size)
+    # Sparse clips only contain the requested frames. Map frame numbers to their position
+    if options.sparse:
+        positions = [{n: i for i, n in enumerate(sparse_frames(f))} for f in frame_lists]
+        requests = [r._replace(frame=positions[r.clip][r.frame]) for r in requests]
+    # Fit frames in flight, queued images and the frame cache into the memory budget
+    groups = [list(range(clip_len))]
+    queue_size = cache_mb = None
+    if options.memory_budget:
+        workers = options.encode_processes or writers or max(1, (os.cpu_count() or 2) // 2)
+        plan = plan_memory(clips, options.memory_budget, in_flight, workers, stacked=bool(overlays),
+                           cache_size=options.cache_size)
+        in_flight, queue_size, groups, cache_mb = plan.in_flight, plan.queue_size, plan.groups, plan.cache_mb
+        if not options.quiet:
+            print(f"Memory budget: {options.memory_budget / 1024 ** 3:.1f} GB, {in_flight} frames in flight, "
+                  f"{queue_size} queued images, {cache_mb} MB frame cache, clips rendered in {len(groups)} group(s)")
+    rgbs = []
+    for i, c in enumerate(clips):
+        if overlays:
+            c = core.std.StackVertical([c, overlays[i]])
+        with span(trace, 'graph_to_rgb', clip=i):
+            rgb = to_rgb(c, matrices[i] if matrices else None)
+        if profiler:
+            rgb = profiler.request(profiler.probe(rgb, i, 'to_rgb'), i)
+        rgbs.append(rgb)
+    total = len(requests)
+    rendered = 0
 
-    if offset:
-        src_frames = [x + offset for x in frames]
-    else:
-        src_frames = frames
-
-    # Generate tags. Increment chars to prevent overwriting
-    for file in folder.iterdir():
-        if file.suffix in ('.jpg', '.jpeg', '.png'):
-            char = ord(re.search("[A-Za-z]", file.name)[0])
-            if char and char not in chars:
-                chars.append(char)
-    if len(chars) == 0:
-        tags = [chr(ord('a') + c) for c in range(0, clip_len)]
-    else:
-        tags = [chr(c + clip_len) for c in chars]
-        if len(tags) < clip_len:
-            difference = clip_len - len(tags)
-            for i in range(1, difference + 1):
-                last = tags[-1]
-                tags.append(chr(ord(last) + 1))
+    lock = threading.Lock()
+
+    def variant_images(clean, overlay, name):
+        for variant in variants:
+            out = folders[variant]
+            if variant == 'clean':
+                yield clean, out / f"{name}{suffix}", {'variant': variant}
+            elif variant == 'overlay':
+                yield overlay, out / f"{name}{suffix}", {'variant': variant}
+            elif variant == 'roi':
+                for roi, x, y, width, height in options.rois:
+                    for scale in options.roi_scales:
+                        yield (roi_crop(clean, x, y, width, height, scale), out / f"{name}-{roi}-{scale}x{suffix}",
+                               {'variant': variant, 'roi': roi, 'scale': scale})
+            elif variant == 'thumb':
+                yield thumbnail(clean, options.thumb_width), out / f"{name}{suffix}", {'variant': variant}
+
+    def saved(images, remaining, clip, frame, i, variant, location):
+        # Only report a frame once every variant of it is written
+        with lock:
+            images[i] = {**location, **variant}
+            remaining[0] -= 1
+            if remaining[0]:
+                return
+        on_saved(clip, frame, images)
+
+    def cache_put(clip, original, image):
+        with span(trace, 'render_cache_put', clip=clip, frame=original):
+            render_cache.put(cache_keys[clip], original, image)
+
+    def save(request, frame):
+        original = frame_lists[request.clip][request.index - 1]
+        with span(trace, 'frame_to_array', clip=request.clip, frame=request.frame):
+            image = writer.frame_to_array(frame)
+        try:
+            if render_cache:
+                writer.run(partial(cache_put, request.clip, original), image)
+            save_image(request, image)
+        finally:
+            # Queued images hold the frame's shared memory until they are written
+            writer.release(image)
+
+    def save_image(request, image):
+        nonlocal rendered
+        original = frame_lists[request.clip][request.index - 1]
+        with span(trace, 'variants', clip=request.clip, frame=request.frame):
+            if overlays:
+                height = image.shape[0] // 2
+                clean, overlay = image[:height], image[height:]
+            else:
+                clean = overlay = image
+            images = list(variant_images(clean, overlay, f"{request.index:02d}{request.tag}"))
+        done = None
+        if on_saved:
+            done = partial(saved, [None] * len(images), [len(images)], request.clip, original)
+        meta = {'clip': request.clip, 'tag': request.tag, 'frame': original, 'index': request.index}
+        for i, (image, path, variant) in enumerate(images):
+            writer.submit(image, path, partial(done, i, variant) if done else None, {**meta, **variant})
+        if grid_builder:
+            with span(trace, 'grid', clip=request.clip, frame=request.frame):
+                completed = grid_builder.add(request.clip, request.index, original, clean)
+            for image, name in completed:
+                writer.submit(image, grid_folder / f"{name}{suffix}", meta={'grid': name})
+        rendered += 1
+        if not options.quiet:
+            print(f"Rendered frame {rendered}/{total}", end="\r")
 
-    # screenshots for source. Pop src tag to prevent conflict
-    if not no_source:
-        awf.ScreenGen(clips[0], folder, tags[0], frame_numbers=src_frames)
-        tags.pop(0)
-    for i, clip in enumerate(clips[1:]):
-        awf.ScreenGen(clip, folder, tags[i], frame_numbers=frames)
+    suffix = IMAGE_FORMATS[options.image_format]
+    params = encode_params(options.image_format, options.compression, options.quality)
+    # A single variant is saved straight to the folder, like before variants existed
+    folders = {v: folder / v if len(variants) > 1 else folder for v in variants}
+    grid_builder = None
+    if options.grids:
+        grid_builder = GridBuilder(options.grids, options.titles, tags, max(len(f) for f in frame_lists),
+                                   options.tile_width, options.grid_columns)
+        grid_folder = folder / 'grids'
+    # Archives are named after the first tag, so every run (and a resumed run) has its own
+    folder.mkdir(parents=True, exist_ok=True)
+    output = open_sink(options.sink, folder, f"screenshots-{tags[0]}" + (f"-{shard}" if shard is not None else ''))
+    try:
+        with ImageWriter(workers=writers, queue_size=queue_size, params=params, report=report, trace=trace,
+                         sink=output, store=store, processes=options.encode_processes) as writer, cache_limit(cache_mb):
+            start = time.perf_counter()
+            if render_cache:
+                # Frames rendered by an earlier run are saved straight from the cache, without decoding
+                misses = []
+                for request in requests:
+                    with span(trace, 'render_cache_get', clip=request.clip, frame=request.frame):
+                        original = frame_lists[request.clip][request.index - 1]
+                        image = render_cache.get(cache_keys[request.clip], original)
+                    if image is None:
+                        misses.append(request)
+                    else:
+                        save_image(request, image)
+                requests = misses
+            for group in groups:
+                members = set(group)
+                # Keep each decoder's requests close together while the other clips in the group fill the window
+                per_clip = max(1, (in_flight or core.num_threads) // len(group))
+                render_frames(rgbs, [r for r in requests if r.clip in members], save, max_in_flight=in_flight,
+                              max_per_clip=per_clip, report=report, trace=trace)
+                # Drop finished clips so their cached frames can be freed before the next group
+                if len(groups) > 1:
+                    for i in group:
+                        rgbs[i] = None
+            if grid_builder:
+                with span(trace, 'grid'):
+                    for image, name in grid_builder.finish():
+                        writer.submit(image, grid_folder / f"{name}{suffix}", meta={'grid': name})
+            render_time = time.perf_counter() - start
+    finally:
+        output.close()
+    write_time = time.perf_counter() - start - render_time
+
+    if report:
+        report.add_stage('render', render_time)
+        report.add_stage('write', write_time)
+
+    if not options.quiet:
+        # Time blocked on a full queue counts against encoding, not rendering
+        busy = render_time - writer.blocked_seconds
+        print(f"\nSaved {writer.frames} images ({', '.join(variants)}) to '{output.path}'")
+        if grid_builder and grid_builder.incomplete:
+            print(f"Skipped {len(grid_builder.incomplete)} grids missing frames that were already saved: "
+                  f"{', '.join(grid_builder.incomplete)}")
+        print(
+            f"Render: {rendered} frames in {render_time:.2f}s ({rendered / busy if busy > 0 else 0:.2f} fps while "
+            f"not blocked), waited {writer.blocked_seconds:.2f}s on the encoder queue"
+        )
+        print(writer.summary())
+        if render_cache:
+            print(render_cache.summary())
+    if render_cache:
+        render_cache.evict()
+    if store:
+        store.evict()
+    if writer.duplicates:
+        record_duplicates(folder, writer.duplicates)
 
 
 def generate_random_frames(clips: list[vs.VideoNode],
-                           frame_range: list[int]) -> list[int]:
+                           frame_range: list[int],
+                           seed: int = None) -> list[int]:
     """
     Generate random frames for screenshots.
 
@@ -237,6 +661,7 @@ def generate_random_frames(clips: list[vs.VideoNode],
 
     :param clips: Encoded clips. Used to get frame counts where the smallest value is used for stop
     :param frame_range: Frame range and count in the form [start, stop, count]
+    :param seed: Seed for the random number generator. Default is unseeded
     :return: A list of random, sequential frames
     """
 
@@ -247,66 +672,398 @@ def generate_random_frames(clips: list[vs.VideoNode],
 
     # Handle out-of-bounds errors if stop is greater than frame count
     stop = frame_range[1] if frame_range[1] < frame_count - 5 else frame_count - 5
-    rand_frames = random.sample(range(frame_range[0], stop), frame_range[2])
+    rand_frames = random.Random(seed).sample(range(frame_range[0], stop), frame_range[2])
     rand_frames.sort()
 
     return rand_frames
 
 
-def main():
-    (files,
-     crop,
-     titles,
-     out_folder,
-     kernel,
-     overlay,
-     frames,
-     rand_frames,
-     offset,
-     load_filter,
-     no_source) = parse_args()
+def shard_frames(frames: list[int], shards: int) -> list[list[int]]:
+    """
+    Split screenshot frames into groups of neighbouring frames, so each worker decodes its own
+    part of the file.
+    :param frames: Screenshot frames
+    :param shards: Number of groups
+    :return: Positions in `frames` of the frames in each group
+    """
 
-    if no_source:
-        index = 0
+    order = sorted(range(len(frames)), key=lambda i: frames[i])
+    size = math.ceil(len(order) / shards)
+
+    return [sorted(order[i:i + size]) for i in range(0, len(order), size)]
+
+
+def shard_options(options: Options, frames: list[int], shard: int, shards: int) -> Options:
+    """
+    Adjust parsed options for one worker process.
+    :param options: Options returned by `parse_args`
+    :param frames: Screenshot frames, resolved by the coordinator
+    :param shard: Worker number
+    :param shards: Number of workers
+    :return: Options for the worker
+    """
+
+    def per_worker(path):
+        return path.with_name(f"{path.stem}-{shard}{path.suffix}") if path else None
+
+    return replace(
+        options,
+        # Frames are resolved once, so random frames are the same in every worker
+        frames=frames,
+        rand_frames=None,
+        # Split the default encoder threads (or processes) between workers
+        writers=options.writers or max(1, (os.cpu_count() or 2) // 2 // shards),
+        encode_processes=max(1, options.encode_processes // shards) if options.encode_processes else None,
+        # Each worker gets an equal part of the memory budget, VapourSynth threads and frame cache
+        memory_budget=options.memory_budget // shards if options.memory_budget else None,
+        threads=max(1, (options.threads or os.cpu_count() or 1) // shards),
+        cache_size=max(1, options.cache_size // shards) if options.cache_size else None,
+        # Reports and traces are written per worker
+        report_path=per_worker(options.report_path),
+        trace_path=per_worker(options.trace_path),
+        # Contact sheets need every frame of a clip, which no single worker renders
+        grids=[g for g in options.grids if g != 'contact'] if options.grids else None,
+        processes=1
+    )
+
+
+def run_shard(options: Options, tags: list[str], skip: set[tuple[int, int]], shard: int, shards: int,
+              saved: queue.Queue) -> None:
+    """
+    Worker process entry point. Renders one shard of a run with its own VapourSynth core.
+    :param options: Options from `shard_options`
+    :param tags: Tag for each clip, allocated by the coordinator
+    :param skip: (clip index, frame) pairs rendered by other workers or already saved
+    :param shard: Worker number
+    :param shards: Number of workers
+    :param saved: Queue shared with the coordinator. (clip index, frame, saved images) is put on it for each
+        frame as soon as it is saved
+    :return: Void
+    """
+
+    run(options, tags=tags, skip=skip, on_saved=lambda clip, frame, images: saved.put((clip, frame, images)),
+        shard=shard)
+
+
+def run_sharded(options: Options,
+                frames: list[int],
+                tags: list[str],
+                skip: set[tuple[int, int]] = None,
+                on_saved: Callable[[int, int, list[dict]], None] = None,
+                processes: int = 2) -> None:
+    """
+    Split a run across worker processes and wait for them.
+
+    Each worker builds its own graph from the shared index cache and renders a group of
+    neighbouring frames for every clip, skipping the frames given to the other workers. Tags and
+    frame numbers are decided here, so every worker writes to the same folder with the same names
+    a single process would use.
+
+    :param options: Options returned by `parse_args`
+    :param frames: Screenshot frames
+    :param tags: Tag for each clip
+    :param skip: (clip index, frame) pairs that were already saved and should not be rendered again
+    :param on_saved: Function called with the clip index, frame and saved images once every image of a frame is
+        written. Each image has its variant and its 'path', or its 'archive' and 'entry' name
+    :param processes: Number of worker processes
+    :return: Void
+    """
+
+    frame_lists = clip_frames(frames, options.offset, len(options.files), options.no_source)
+    shards = shard_frames(frames, processes)
+    if options.grids and 'contact' in options.grids:
+        print("WARNING: Contact sheets are not built when frames are split across processes")
+
+    print(f"Splitting {len(frames)} frames across {len(shards)} processes\n")
+    # Workers start from a fresh interpreter. Forking would copy this process's VapourSynth threads
+    context = multiprocessing.get_context('spawn')
+    with context.Manager() as manager, ProcessPoolExecutor(max_workers=len(shards), mp_context=context) as executor:
+        saved = manager.Queue()
+        futures = []
+        for i, positions in enumerate(shards):
+            other = set(range(len(frames))) - set(positions)
+            shard_skip = {(c, f[j]) for c, f in enumerate(frame_lists) for j in other} | (skip or set())
+            futures.append(executor.submit(run_shard, shard_options(options, frames, i, len(shards)), tags,
+                                           shard_skip, i, len(shards), saved))
+        # Frames are reported as workers save them. Workers put every frame before they finish,
+        # so the queue is drained once it is empty and every worker is done
+        while True:
+            try:
+                clip, frame, images = saved.get(timeout=0.5)
+            except queue.Empty:
+                if all(f.done() for f in futures):
+                    break
+                continue
+            if on_saved:
+                on_saved(clip, frame, images)
+        for future in futures:
+            future.result()
+
+    print(f"All {len(shards)} processes finished")
+
+
+class PreparedClips(NamedTuple):
+    clips: list[vs.VideoNode]
+    overlays: list[vs.VideoNode] | None
+    metadata: list[dict]
+    matrices: list[int] | None
+    sizes: list[list[int]]
+    variants: list[str]
+    add_frame_info: bool
+    keyframes: list[list[int] | None] | None
+
+
+def prepare_job(clips: list[vs.VideoNode],
+                metadata: list[dict],
+                crop: list[int],
+                titles: list[str] = None,
+                kernel: str = 'spline36',
+                overlay: bool = True,
+                variants: list[str] = None,
+                no_source: bool = False,
+                frames: list[list[int]] = None,
+                report: RunReport = None,
+                trace: Trace = None,
+                profiler: GraphProfiler = None,
+                quiet: bool = False,
+                keyframes: list[list[int] | None] = None) -> PreparedClips:
+    """
+    Build the filter graph for loaded clips: resize the source if needed, then crop, tonemap and
+    add overlays.
+    :param clips: Loaded clips. The first clip is the source unless `no_source` is set
+    :param metadata: Probed metadata for each clip
+    :param crop: Dimensions used for cropping clips
+    :param titles: Titles used for frame info overlays
+    :param kernel: Kernel used to resize the source
+    :param overlay: Boolean indicating if frame info overlays are added when no variants are passed
+    :param variants: Images saved from each frame. One of VARIANTS
+    :param no_source: Boolean indicating if source was passed
+    :param frames: Frames to keep for each clip. When passed, clips are built with `sparse_clip`
+    :param report: Run report used to time each step
+    :param trace: Trace used to record a span for each step
+    :param profiler: Profiler used to time each step per frame
+    :param quiet: Don't print crop values and other progress
+    :param keyframes: Keyframe numbers for each clip, read from the source index. Kept so pooled clips don't
+        read the index again
+    :return: Prepared clips and what is needed to render them
+    """
+
+    if len(clips) > 1 and not no_source:
+        # Check if source requires resizing
+        with stage(report, 'graph_resize'), span(trace, 'graph_resize'):
+            resized = verify_resize(clips, kernel=kernel, quiet=quiet)
+        if profiler and resized is not clips[0]:
+            resized = profiler.probe(resized, 0, 'resize', sparse=False)
+        clips[0] = resized
+
+    # Overlays are added separately when clean images are saved from the same frames
+    if not variants:
+        variants = ['overlay'] if overlay else ['clean']
+    clean = any(v in variants for v in ('clean', 'roi', 'thumb'))
+    add_frame_info = 'overlay' in variants and not clean
+
+    # Size of each clip before cropping. Decides how the source was resized
+    sizes = [[c.width, c.height] for c in clips]
+
+    # Crop, Tonemap (if applicable), and Frame Info (if applicable)
+    clips = prepare_clips(clips=clips, crop_dimensions=crop, clip_titles=titles if titles else None,
+                          add_frame_info=add_frame_info, frames=frames, metadata=metadata, report=report,
+                          trace=trace, profiler=profiler, quiet=quiet)
+    overlays = None
+    if clean and 'overlay' in variants:
+        with stage(report, 'graph_overlay'), span(trace, 'graph_overlay'):
+            overlays = overlay_clips(clips, titles)
+
+    # Tonemapping changes the format, so probed matrices only apply to untouched clips
+    matrices = None if needs_tonemap(clips[0], metadata[0]) else [m['matrix'] for m in metadata]
+
+    return PreparedClips(clips, overlays, metadata, matrices, sizes, variants, add_frame_info, keyframes)
+
+
+def sample_options(options: Options, folder: Path, settings: dict) -> Options:
+    """
+    Adjust parsed options to render a short sample of the job for the auto-tuner.
+    :param options: Options returned by `parse_args`
+    :param folder: Temporary output folder
+    :param settings: Settings to render with, picked by `autotune` from `candidate_settings`
+    :return: Options for the sample
+    """
+
+    sample = replace(
+        options,
+        out_folder=folder,
+        writers=settings['writers'],
+        threads=settings['threads'],
+        cache_size=settings['cache_size'],
+        autotune=False,
+        quiet=True,
+        # The memory budget would replace the cache size being tried
+        memory_budget=None,
+        # No reports, and no caches that would skip rendering or encoding
+        report_path=None,
+        trace_path=None,
+        profile_filters=False,
+        store=None,
+        render_cache=None,
+        processes=1
+    )
+    if options.frames:
+        return replace(sample, frames=options.frames[:SAMPLE_FRAMES])
+    start, stop, count = options.rand_frames
+    return replace(sample, rand_frames=[start, stop, min(count, SAMPLE_FRAMES)], seed=options.seed or 0)
+
+
+def render_sample(options: Options, settings: dict) -> None:
+    """
+    Render a short sample of the job into a temporary folder. Used by the auto-tuner.
+    :param options: Options returned by `parse_args`
+    :param settings: Settings to render with, picked by `autotune` from `candidate_settings`
+    :return: Void
+    """
+
+    with tempfile.TemporaryDirectory(prefix='screenshots-autotune-') as folder:
+        run(sample_options(options, Path(folder), settings))
+
+
+def run(options: Options,
+        tags: list[str] = None,
+        skip: set[tuple[int, int]] = None,
+        on_saved: Callable[[int, int, list[dict]], None] = None,
+        shard: int = None,
+        pool: ClipPool = None) -> None:
+
+    """
+    Generate screenshots for one set of parsed options.
+    :param options: Options returned by `parse_args`
+    :param tags: Tag for each clip. If not passed, tags are allocated from the output folder
+    :param skip: (clip index, frame) pairs that were already saved and should not be rendered again
+    :param on_saved: Function called with the clip index, frame and saved images once every image of a frame is
+        written. Each image has its variant and its 'path', or its 'archive' and 'entry' name
+    :param shard: Worker number when called from `run_shard`
+    :param pool: Pool of prepared clips kept between runs, e.g. by the daemon
+    :return: Void
+    """
+
+    # Settings passed on the command line win over the settings tuned for this host
+    if options.autotune and shard is None:
+        tuned = autotune(partial(render_sample, options),
+                         candidate_settings(options.threads, options.cache_size, options.writers))
     else:
-        index = 1
-        print("Source: ", files[0])
+        tuned = load_profile() if shard is None else {}
+    # Workers are passed the resolved settings instead of loading the profile again
+    options = replace(options, threads=options.threads or tuned.get('threads'),
+                      cache_size=options.cache_size or tuned.get('cache_size'),
+                      writers=options.writers or tuned.get('writers'), autotune=False)
+    if tuned and not options.quiet:
+        print(f"Using settings tuned for this host: {options.threads} threads, {options.cache_size} MB cache, "
+              f"{options.writers} writers")
+    apply_settings(options.threads, options.cache_size)
+
+    files, crop, titles, frames = options.files, options.crop, options.titles, options.frames
+    offset, no_source, load_filter = options.offset, options.no_source, options.load_filter
 
-    print("Encodes: ", files[index:])
-    print(f"Frame offset: {offset}\n")
+    report = RunReport()
+    trace = Trace() if options.trace_path else None
+    profiler = GraphProfiler(trace) if options.profile_filters else None
+    report.set_clips(files)
 
-    # Load from dir or load files
-    clips = load_clips(files=files, load_filter=load_filter)
+    index = 0 if no_source else 1
+    if not options.quiet:
+        if not no_source:
+            print("Source: ", files[0])
+        print("Encodes: ", files[index:])
+        print(f"Frame offset: {offset}\n")
+
+    # Prepared clips are reused from the pool when the same files are requested with the same settings.
+    # Sparse and profiled graphs depend on the run, so they are always built
+    pool_key = None
+    if pool is not None and not options.sparse and not profiler and options.processes == 1:
+        pool_key = pool.key(files=[fingerprint(f) for f in files], load_filter=load_filter, crop=crop, titles=titles,
+                            kernel=options.kernel, overlay=options.overlay, variants=options.variants,
+                            no_source=no_source)
+    prepared = pool.get(pool_key) if pool_key else None
+
+    if prepared:
+        print("Reusing prepared clips\n")
+        clips, metadata = list(prepared.clips), prepared.metadata
+    else:
+        # Load from dir or load files. Metadata is probed once per file and cached next to the indexes
+        probe_cache = ProbeCache(options.index_cache.root.parent / 'probe' if options.index_cache else None)
+        with report.stage('indexing'):
+            clips = load_clips(files=files, load_filter=load_filter, workers=options.index_workers,
+                               index_cache=options.index_cache, probe_cache=probe_cache, trace=trace,
+                               quiet=options.quiet)
+        metadata = [probe_cache.get(c, f, load_filter) for c, f in zip(clips, files)]
+        if profiler:
+            clips = [profiler.probe(c, i, 'decode', sparse=False) for i, c in enumerate(clips)]
 
     if len(clips) == 1:
         if not crop:
             if not no_source:
                 print("WARNING: No crop values were provided. The source will be uncropped.")
             crop = [clips[0].width, clips[0].height]
-        if rand_frames:
-            frames = generate_random_frames(clips, rand_frames)
+        if options.rand_frames:
+            frames = generate_random_frames(clips, options.rand_frames, options.seed)
     elif len(clips) > 1:
-        if rand_frames:
-            frames = generate_random_frames(clips[index:], rand_frames)
+        if options.rand_frames:
+            frames = generate_random_frames(clips[index:], options.rand_frames, options.seed)
         # If no crop passed, use encode 1 dimensions
         if not crop:
             crop = [clips[index].width, clips[index].height]
-        if not no_source:
-            # Check if source requires resizing
-            clips[0] = verify_resize(clips, kernel=kernel)
     else:
         raise ValueError("The number of clips could not be determined, or an unexpected value was received.")
 
-    # Crop, Tonemap (if applicable), and Frame Info (if applicable)
-    kwargs = {
-        'clips': clips,
-        'crop_dimensions': crop,
-        'clip_titles': titles if titles else None,
-        'add_frame_info': overlay
-    }
-    clips = prepare_clips(**kwargs)
-
-    generate_screenshots(clips, out_folder, frames, offset, no_source=no_source)
+    # Indexes are built and frames resolved once, then workers build their own graphs
+    if options.processes > 1 and shard is None:
+        if not tags:
+            tags = allocate_tags(options.out_folder, files, clip_frames(frames, offset, len(clips), no_source))
+        run_sharded(options, frames, tags, skip=skip, on_saved=on_saved, processes=options.processes)
+        return
+
+    if not prepared:
+        sparse_lists = clip_frames(frames, offset, len(clips), no_source) if options.sparse else None
+        keyframes = [read_keyframes(index_path(f, load_filter, options.index_cache)) for f in files]
+        prepared = prepare_job(clips, metadata, crop, titles, options.kernel, options.overlay, options.variants,
+                               no_source, sparse_lists, report, trace, profiler, options.quiet, keyframes)
+        if pool_key:
+            pool.put(pool_key, prepared)
+    clips, overlays, matrices = prepared.clips, prepared.overlays, prepared.matrices
+
+    # Everything that changes the rendered pixels of a clip, besides the frame number. Keys don't depend on
+    # the other clips, so adding an encode to a comparison still reuses the source frames
+    cache_keys = None
+    if options.render_cache:
+        overlay_mode = 'stacked' if overlays else 'frame_info' if prepared.add_frame_info else None
+        # Overlays fall back to numbered titles when the titles don't match the clips
+        overlay_titles = titles if titles and len(titles) == len(clips) else [f"Clip {i}" for i in range(len(clips))]
+        cache_keys = [
+            options.render_cache.key(file=fingerprint(f), load_filter=load_filter, size=prepared.sizes[i],
+                                     kernel=options.kernel, crop=crop, tonemap=needs_tonemap(clips[0], metadata[0]),
+                                     overlay=overlay_mode, title=overlay_titles[i] if overlay_mode else None,
+                                     sparse=options.sparse, matrix=matrices[i] if matrices else None,
+                                     width=c.width, height=c.height, format=c.format.name)
+            for i, (f, c) in enumerate(zip(files, clips))
+        ]
+
+    if not tags:
+        tags = allocate_tags(options.out_folder, files, clip_frames(frames, offset, len(clips), no_source))
+    generate_screenshots(clips, options.out_folder, frames, options,
+                         keyframes=prepared.keyframes, matrices=matrices, overlays=overlays, variants=prepared.variants,
+                         tags=tags, skip=skip, on_saved=on_saved, cache_keys=cache_keys, shard=shard, report=report,
+                         trace=trace, profiler=profiler)
+
+    if profiler:
+        profiler.print_summary(titles)
+        report.set_filters(profiler.summary())
+
+    if options.report_path:
+        report.write(options.report_path)
+    if trace:
+        trace.write(options.trace_path)
+
+
+def main():
+    run(parse_args())
 
 
 if __name__ == '__main__':
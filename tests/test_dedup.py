@@ -0,0 +1,72 @@
+import os
+import pickle
+
+import pytest
+
+pytest.importorskip('vapoursynth')
+np = pytest.importorskip('numpy')
+
+from modules.dedup import ImageStore
+from modules.sink import DirectorySink
+
+
+def image(value):
+    return np.full((4, 4, 3), value, dtype=np.uint8)
+
+
+def test_key_depends_on_pixels_and_settings():
+    key = ImageStore.key(image(1), '.png', [16, 9])
+
+    assert key == ImageStore.key(image(1), '.png', [16, 9])
+    assert len({key, ImageStore.key(image(2), '.png', [16, 9]), ImageStore.key(image(1), '.webp', [16, 9]),
+                ImageStore.key(image(1), '.png', [16, 1])}) == 4
+
+
+def test_add_links_the_output_file(tmp_path):
+    store = ImageStore(tmp_path / 'store')
+    output = tmp_path / '01a.png'
+    output.write_bytes(b'encoded')
+    key = ImageStore.key(image(1), '.png')
+
+    assert store.find(key, '.png') is None
+    store.add(key, '.png', b'encoded', output)
+    stored = store.find(key, '.png')
+
+    assert stored.read_bytes() == b'encoded'
+    assert os.path.samefile(stored, output)
+    assert (store.hits, store.misses) == (1, 1)
+
+
+def test_overwriting_a_linked_output_keeps_the_store_entry(tmp_path):
+    store = ImageStore(tmp_path / 'store')
+    sink = DirectorySink(tmp_path / 'out')
+    path = tmp_path / 'out' / 'grids' / 'compare-01a-b.png'
+    first, second = ImageStore.key(image(1), '.png'), ImageStore.key(image(2), '.png')
+
+    sink.write(path, b'first')
+    store.add(first, '.png', b'first', path)
+    sink.write(path, b'second')
+    store.add(second, '.png', b'second', path)
+
+    assert path.read_bytes() == b'second'
+    assert store.find(first, '.png').read_bytes() == b'first'
+    assert store.find(second, '.png').read_bytes() == b'second'
+
+
+def test_evict_keeps_images_used_by_the_run(tmp_path):
+    old = ImageStore(tmp_path)
+    for i in range(3):
+        old.add(f"{i:02d}", '.png', b'x' * 100)
+        os.utime(old.path(f"{i:02d}", '.png'), (i, i))
+
+    store = ImageStore(tmp_path, max_size=150)
+    store.find('00', '.png')
+    store.evict()
+
+    assert [p.name for p in sorted(tmp_path.glob('*/*.png'))] == ['00.png']
+
+
+def test_pickled_store_keeps_settings(tmp_path):
+    store = pickle.loads(pickle.dumps(ImageStore(tmp_path, max_size=123)))
+
+    assert (store.root, store.max_size, store.used) == (tmp_path, 123, set())
@@ -0,0 +1,47 @@
+import pytest
+
+pytest.importorskip('vapoursynth')
+np = pytest.importorskip('numpy')
+pytest.importorskip('cv2')
+
+from modules.grid import GridBuilder, tile_images
+
+
+def image(value, width=64, height=36):
+    return np.full((height, width, 3), value, dtype=np.uint8)
+
+
+def test_tile_images_fills_missing_tiles():
+    grid = tile_images([image(10), image(20), None], columns=2)
+
+    assert grid.shape == (72, 128, 3)
+    assert grid[0, 0, 0] == 10 and grid[0, 64, 0] == 20 and grid[36, 0, 0] == 0
+
+
+def test_compare_grid_waits_for_every_clip():
+    builder = GridBuilder(['compare'], ['Source', 'Encode'], ['a', 'b', 'c', 'd'], 1, tile_width=32)
+
+    for clip in range(3):
+        assert builder.add(clip, 1, 100, image(clip)) == []
+    (grid, name), = builder.add(3, 1, 100, image(3))
+
+    assert name == 'compare-01a-d'
+    assert builder.titles == ['Clip 0', 'Clip 1', 'Clip 2', 'Clip 3']
+
+
+def test_single_clip_compare_grid_name():
+    builder = GridBuilder(['compare'], None, ['e'], 1, tile_width=32)
+
+    assert [name for _, name in builder.add(0, 1, 5, image(0))] == ['compare-01e']
+
+
+def test_finish_skips_incomplete_grids():
+    builder = GridBuilder(['compare', 'contact'], ['A', 'B'], ['a', 'b'], 2, tile_width=32)
+    builder.add(0, 1, 10, image(0))
+    builder.add(0, 2, 20, image(0))
+    builder.add(1, 1, 10, image(1))
+
+    names = [name for _, name in builder.finish()]
+
+    assert names == ['contact-a']
+    assert builder.incomplete == ['compare-02a-b', 'contact-b']
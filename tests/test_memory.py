@@ -0,0 +1,66 @@
+from types import SimpleNamespace
+
+import pytest
+
+vs = pytest.importorskip('vapoursynth')
+
+from modules.memory import DEFAULT_CACHE_MB, cache_limit, frame_bytes, plan_memory, request_bytes
+
+MB = 1024 ** 2
+
+
+def clip(width=1920, height=1080, bytes_per_sample=1, subsampling=1, planes=3):
+    fmt = SimpleNamespace(bytes_per_sample=bytes_per_sample, subsampling_w=subsampling, subsampling_h=subsampling,
+                          num_planes=planes)
+    return SimpleNamespace(width=width, height=height, format=fmt)
+
+
+def test_frame_bytes():
+    assert frame_bytes(clip()) == 1920 * 1080 * 3 // 2
+    assert frame_bytes(clip(bytes_per_sample=2, subsampling=0)) == 1920 * 1080 * 2 * 3
+
+
+def test_request_bytes_counts_stacked_images():
+    assert request_bytes(clip(), 2160) - request_bytes(clip()) == 1920 * 1080 * 3 * 2
+
+
+def test_plan_fits_budget():
+    clips = [clip(), clip()]
+    plan = plan_memory(clips, 512 * MB, in_flight=8, writers=2)
+    per_request, per_image = request_bytes(clips[0]), 1920 * 1080 * 3
+    used = plan.cache_mb * MB + plan.in_flight * per_request + (plan.queue_size + 2) * per_image
+
+    assert used <= 512 * MB
+    assert plan.cache_mb == 128
+    assert plan.groups == [[0, 1]]
+
+
+def test_small_budget_groups_clips():
+    plan = plan_memory([clip(3840, 2160)] * 3, 64 * MB, in_flight=8, writers=1)
+
+    assert plan.in_flight == 1
+    assert plan.groups == [[0], [1], [2]]
+
+
+def test_cache_uses_configured_size_not_current_one():
+    core = vs.core
+    previous = core.max_cache_size
+    core.max_cache_size = 1
+    try:
+        assert plan_memory([clip()], 8192 * MB, in_flight=1).cache_mb == min(DEFAULT_CACHE_MB, 2048)
+        assert plan_memory([clip()], 8192 * MB, in_flight=1, cache_size=100).cache_mb == 100
+    finally:
+        core.max_cache_size = previous
+
+
+def test_cache_limit_restores_previous_limit():
+    core = vs.core
+    previous = core.max_cache_size
+    with cache_limit(7):
+        assert core.max_cache_size == 7
+    assert core.max_cache_size == previous
+
+    with pytest.raises(RuntimeError):
+        with cache_limit(7):
+            raise RuntimeError
+    assert core.max_cache_size == previous
@@ -0,0 +1,86 @@
+import os
+import pickle
+import threading
+
+import pytest
+
+pytest.importorskip('vapoursynth')
+np = pytest.importorskip('numpy')
+
+from modules.output import ImageWriter
+from modules.render_cache import RenderCache
+
+
+def image(value):
+    return np.full((4, 4, 3), value, dtype=np.uint8)
+
+
+def test_key_depends_on_settings():
+    key = RenderCache.key(file='a', crop=[1920, 800])
+
+    assert key == RenderCache.key(crop=[1920, 800], file='a')
+    assert key != RenderCache.key(file='a', crop=[1920, 1080])
+
+
+def test_put_get_roundtrip(tmp_path):
+    cache = RenderCache(tmp_path)
+    key = RenderCache.key(file='a')
+
+    assert cache.get(key, 10) is None
+    cache.put(key, 10, image(7))
+
+    assert np.array_equal(cache.get(key, 10), image(7))
+    assert (cache.hits, cache.misses, cache.bytes_stored) == (1, 1, image(7).nbytes)
+
+
+def test_concurrent_puts_of_a_frame(tmp_path):
+    cache = RenderCache(tmp_path)
+    key = RenderCache.key(file='a')
+    threads = [threading.Thread(target=cache.put, args=(key, 0, image(i))) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert cache.get(key, 0) is not None
+    assert not list(tmp_path.glob('*/*.tmp'))
+
+
+def test_put_from_writer(tmp_path):
+    cache = RenderCache(tmp_path)
+    key = RenderCache.key(file='a')
+    with ImageWriter(workers=2) as writer:
+        writer.run(lambda img: cache.put(key, 3, img), image(5))
+
+    assert writer.frames == 0
+    assert np.array_equal(cache.get(key, 3), image(5))
+
+
+def test_unreadable_frame_is_discarded(tmp_path):
+    cache = RenderCache(tmp_path)
+    key = RenderCache.key(file='a')
+    path = cache.path(key, 0)
+    path.parent.mkdir(parents=True)
+    path.write_bytes(b'broken')
+
+    assert cache.get(key, 0) is None
+    assert not path.exists()
+
+
+def test_evict_keeps_frames_used_by_this_run(tmp_path):
+    old = RenderCache(tmp_path)
+    key = RenderCache.key(file='a')
+    old.put(key, 0, image(0))
+    os.utime(old.path(key, 0), (0, 0))
+    cache = RenderCache(tmp_path, max_size=1)
+    cache.put(key, 1, image(1))
+    cache.evict()
+
+    assert not cache.path(key, 0).exists()
+    assert cache.path(key, 1).exists()
+
+
+def test_pickle(tmp_path):
+    cache = pickle.loads(pickle.dumps(RenderCache(tmp_path, 123)))
+
+    assert (cache.root, cache.max_size) == (tmp_path, 123)
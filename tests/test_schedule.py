@@ -0,0 +1,45 @@
+import pytest
+
+pytest.importorskip('vapoursynth')
+
+from modules.render import FrameRequest
+from modules.schedule import group_frames, read_keyframes, schedule_requests
+
+
+def test_group_frames_by_keyframe():
+    assert group_frames([130, 10, 90, 260], keyframes=[0, 100, 250]) == [[10, 90], [130], [260]]
+
+
+def test_group_frames_before_first_keyframe():
+    assert group_frames([5, 20, 60], keyframes=[12, 50]) == [[5], [20], [60]]
+
+
+def test_group_frames_by_distance():
+    assert group_frames([0, 100, 400, 500], gop_size=250) == [[0, 100], [400, 500]]
+
+
+def test_schedule_interleaves_gops_across_clips():
+    requests = [FrameRequest(clip, frame, i + 1, 'ab'[clip]) for clip in (0, 1) for i, frame in
+                enumerate([600, 10, 20])]
+    scheduled = schedule_requests(requests, gop_size=250)
+
+    assert [(r.clip, r.frame) for r in scheduled] == [(0, 10), (0, 20), (1, 10), (1, 20), (0, 600), (1, 600)]
+
+
+def test_read_keyframes_uses_first_video_stream(tmp_path):
+    index = tmp_path / 'file.lwi'
+    index.write_text(
+        'Index=0,Type=0\nKey=1\n'
+        'Index=1,Type=1\nKey=1\n'
+        'Index=0,Type=0\nKey=0\n'
+        'Index=0,Type=0\nKey=1\n'
+    )
+
+    assert read_keyframes(index) == [0, 2]
+
+
+def test_read_keyframes_ignores_other_indexes(tmp_path):
+    index = tmp_path / 'file.ffindex'
+    index.write_bytes(b'\0')
+
+    assert read_keyframes(index) is None
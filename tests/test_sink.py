@@ -0,0 +1,61 @@
+import json
+import tarfile
+import zipfile
+
+import pytest
+
+pytest.importorskip('vapoursynth')
+
+from modules.sink import DirectorySink, open_sink
+
+
+def test_directory_sink_writes_files(tmp_path):
+    sink = open_sink('dir', tmp_path)
+    path = tmp_path / 'clean' / '01a.png'
+
+    assert isinstance(sink, DirectorySink)
+    assert sink.write(path, b'image') == 5
+    assert path.read_bytes() == b'image'
+    assert sink.location(path) == {'path': str(path)}
+
+
+@pytest.mark.parametrize('kind', ['tar', 'zip'])
+def test_archive_sink_indexes_entries(tmp_path, kind):
+    sink = open_sink(kind, tmp_path, 'shots')
+    sink.write(tmp_path / 'clean' / '01a.png', b'first', {'clip': 0, 'frame': 10})
+    sink.write(tmp_path / 'clean' / '01b.png', b'second', {'clip': 1, 'frame': 10})
+    location = sink.location(tmp_path / 'clean' / '01b.png')
+    sink.close()
+
+    archive = tmp_path / f"shots.{kind}"
+    index = json.loads((tmp_path / f"shots.{kind}.index.json").read_text())
+    assert location == {'archive': str(archive), 'entry': 'clean/01b.png'}
+    assert [(e['name'], e['clip'], e['size']) for e in index['entries']] == [
+        ('clean/01a.png', 0, 5), ('clean/01b.png', 1, 6)
+    ]
+    if kind == 'tar':
+        data = archive.read_bytes()
+        assert [data[e['offset']:e['offset'] + e['size']] for e in index['entries']] == [b'first', b'second']
+        with tarfile.open(archive) as tar:
+            assert tar.extractfile('clean/01b.png').read() == b'second'
+    else:
+        with zipfile.ZipFile(archive) as z:
+            assert [i.header_offset for i in z.infolist()] == [e['offset'] for e in index['entries']]
+
+
+@pytest.mark.parametrize('kind', ['tar', 'zip'])
+def test_archive_sink_appends_on_resume(tmp_path, kind):
+    sink = open_sink(kind, tmp_path, 'shots')
+    sink.write(tmp_path / '01a.png', b'first')
+    sink.close()
+    sink = open_sink(kind, tmp_path, 'shots')
+    sink.write(tmp_path / '02a.png', b'second')
+    sink.close()
+
+    index = json.loads((tmp_path / f"shots.{kind}.index.json").read_text())
+    assert [e['name'] for e in index['entries']] == ['01a.png', '02a.png']
+
+
+def test_unknown_sink(tmp_path):
+    with pytest.raises(ValueError):
+        open_sink('s3', tmp_path)
@@ -0,0 +1,49 @@
+import pytest
+
+vs = pytest.importorskip('vapoursynth')
+
+from modules import tuning
+from modules.tuning import autotune, candidate_settings, load_profile
+
+
+@pytest.fixture
+def profile(tmp_path, monkeypatch):
+    path = tmp_path / 'tuning.json'
+    monkeypatch.setattr(tuning, 'default_cache_dir', lambda: tmp_path)
+    return path
+
+
+def test_fixed_settings_are_not_tuned():
+    candidates = candidate_settings(threads=3, cache_size=100)
+
+    assert candidates['threads'] == [3]
+    assert candidates['cache_size'] == [100]
+    assert len(candidates['writers']) >= 1
+
+
+def test_coordinate_search_finds_fastest(profile, monkeypatch):
+    candidates = {'threads': [1, 2, 4], 'cache_size': [256, 512, 1024], 'writers': [1, 2, 4]}
+    # Cost is lowest at threads=4, cache=512, writers=1
+    cost = {'threads': {1: 3, 2: 2, 4: 1}, 'cache_size': {256: 3, 512: 1, 1024: 2}, 'writers': {1: 1, 2: 2, 4: 3}}
+    clock = [0.0]
+    runs = []
+
+    def render_sample(settings):
+        runs.append(dict(settings))
+        clock[0] += sum(cost[name][value] for name, value in settings.items())
+
+    monkeypatch.setattr(tuning.time, 'perf_counter', lambda: clock[0])
+    best = autotune(render_sample, candidates)
+
+    assert best == {'threads': 4, 'cache_size': 512, 'writers': 1}
+    # Warm-up, the starting point and two other values of each setting
+    assert len(runs) == 1 + 1 + 2 * 3
+    assert load_profile(profile)['threads'] == 4
+
+
+def test_autotune_restores_core_settings(profile):
+    core = vs.core
+    before = core.num_threads, core.max_cache_size
+    autotune(lambda settings: None, {'threads': [1, 2], 'cache_size': [300], 'writers': [1]})
+
+    assert (core.num_threads, core.max_cache_size) == before